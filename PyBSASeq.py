@@ -8,10 +8,121 @@ import time
 import datetime
 import argparse
 import csv
+import shutil
+import json
+import hashlib
+import importlib
+import importlib.util
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import savgol_filter
+
+# Fisher's exact test: the cached log-factorial table, the number of matrix elements processed at a time, and the
+# relative tolerance used to compare the probabilities of two tables
+lnFactArr = np.zeros(1)
+feBlockSize = 2**16
+feRelTol = np.log1p(1e-7)
+
+# Binomial tail probability ignored when the probability of a SNP being a sSNP is calculated analytically
+nullTailProb = 1e-12
+
+# Memory budget of a chunk of simulated replications, and the number of bytes used per simulated SNP, the peak
+# memory of a chunk measured with tracemalloc (up to 105 bytes, when the SNPs are sampled) with some headroom
+smMemBudget = 2**30
+smBytesPerSNP = 112
+
+# Number of replications simulated with the same random number stream. The replications are split into blocks of
+# this size regardless of the number of worker processes, so the thresholds do not depend on it
+smBlockSize = 250
+
+# Adaptive threshold calculation: the number of replications simulated at a time, and the confidence level of the
+# interval of the 99.5th percentile used as the stopping criterion
+smAdaptBatch = 1000
+smAdaptConf = 0.95
+
+# SNP data of the current threshold simulation, inherited by the worker processes
+smData = None
+
+# SNP table and chromosome index of the last input file read in this process, reused by the next run with the same
+# file, e.g. the next job of a batch
+snpTables = {}
+
+# Filtering categories of the SNPs; the index of a category is the code assigned to the SNPs that fail its rule
+snpCategories = ['SNP', 'Unmapped', 'NA', '1altFake', 'Heterozygous', 'InDel', 'Repetitive', 'ZeroLD', 'LowGQ']
+
+# Record of a filtered SNP when the filtered SNPs are saved as codes: its row number in the input file and the code of
+# its category in snpCategories
+filterCodeDtype = np.dtype([('row', '<i8'), ('code', 'i1')])
+
+# File extensions of the formats of the output files, which are compressed according to their extensions
+fmtExt = {'csv':'', 'csv.gz':'.gz', 'csv.zst':'.zst', 'codes':''}
+
+# Files written in the folder of the results besides the output file ('--output'), replaced if a named folder is reused
+resultFileNames = ['slidingWindows.csv', 'snpRegion.csv', 'swSweep.csv', 'wrnLog.csv', 'numOfSNPOnChrFile.csv', 'misc_info.csv', 'PyBSASeq.pdf']
+
+# Options the entries of SNP filtering and Fisher's exact test depend on (fisherParamDict in filterAndTest); batch jobs
+# with the same values share these entries
+fisherOptions = ['input', 'fbsize', 'sbsize', 'popstrct', 'replication', 'seed', 'chunksize', 'filteredformat']
+
+# Maximum number of queued writes of the output files; the computation waits for the writer threads beyond it
+outputMaxPending = 64
+
+# Filtering rules: the minimum genotype quality score of a SNP in each bulk, and the locus depth above which a SNP
+# is considered to be from repetitive sequences
+minGQ = 20
+maxLD = 400
+
+# Cache of the two-tail p-values of the 2x2 tables, shared by all the Fisher's exact tests of a run; the entries added
+# by the worker processes of the simulation are merged into the caches of the parent process (cacheMerge)
+feCache = {'keys': np.zeros(0, dtype=np.uint64), 'vals': np.zeros(0), 'hits': np.zeros(0, dtype=np.uint64), 'size': 2**21}
+
+# Caches of the non-rejection intervals of the margins of the 2x2 tables, one for each significance level
+critCache = {}
+
+# Alias tables of the binomial distributions of the simulated ALT reads, one for each ALT allele frequency
+binomTables = {}
+
+
+def readConfig(configFile):
+    # Read a TOML file or a YAML file, the run configuration file or the manifest of a batch. Return its content as a
+    # dictionary. TOML files are read with the module 'tomllib' (Python 3.11 or later) or 'tomli', and YAML files with
+    # the module 'yaml'; they are imported only when such a file is read
+    tomlModule = next((name for name in ['tomllib', 'tomli'] if importlib.util.find_spec(name) is not None), None)
+    with open(configFile, 'rb') as du:
+        if configFile.endswith('.toml') and tomlModule is not None:
+            configDict = importlib.import_module(tomlModule).load(du)
+        elif configFile.endswith(('.yaml', '.yml')) and importlib.util.find_spec('yaml') is not None:
+            import yaml
+            configDict = yaml.safe_load(du) or {}
+        else:
+            print('The run configuration file or the manifest should be a .toml file (the module \'tomli\' is needed before Python 3.11) or a .yaml file (the module \'yaml\' is needed).')
+            sys.exit(1)
+
+    return configDict
+
+
+def configOptions(configDict, parser):
+    '''
+    Check the options in configDict, whose keys are the long names of the command line options, e.g. swsize = 2000000
+    or chromosomes = ['1', '2']. Return a dictionary of the options
+    '''
+    unknownKeys = [k for k in configDict if k not in vars(parser.parse_args([]))]
+    if unknownKeys != []:
+        print('Unknown option(s) in the run configuration file or the manifest: ', unknownKeys)
+        sys.exit(1)
+
+    # Lists of chromosomes, window sizes, and incremental steps are converted to the format of the command line options
+    for option in ['chromosomes', 'swsizes', 'steps']:
+        if isinstance(configDict.get(option), list):
+            configDict[option] = ','.join(str(x) for x in configDict[option])
+
+    return configDict
+
+
+def runConfig(configFile, parser):
+    # Read the run configuration file, a TOML file or a YAML file. Return a dictionary of the options
+    return configOptions(readConfig(configFile), parser)
 
 
 def smAlleleFreq(popStruc, sizeOfBulk, rep):
@@ -32,20 +143,329 @@ def smAlleleFreq(popStruc, sizeOfBulk, rep):
         prob = [0.5, 0.5, 0.0]
 
     for __ in range(rep):
-        altFreq = np.random.choice(pop, sizeOfBulk, p=prob).mean()
+        altFreq = rng.choice(pop, sizeOfBulk, p=prob).mean()
         freqL.append(altFreq)
 
     return sum(freqL)/len(freqL)
 
 
-def chrmFiltering(df, chromosomeList):
+def decodeAD(df, adFieldL):
+    '''
+    Each AD field in adFieldL is decoded into three columns, '<bulk>.AD0', '<bulk>.AD1', and '<bulk>.AD2', containing
+    the first three AD values (0 if absent) as unsigned integers; the values are NA if the AD field is missing.
+    The AD strings are converted to a matrix of bytes, one column for each SNP, and the digits of the values are
+    accumulated row by row, without splitting the strings; a value with a character other than a digit is 0, as it
+    is not a number
+    '''
+    for adField in adFieldL:
+        adS = df.pop(adField)
+        missing = adS.isna().to_numpy()
+        charArr = adS.fillna('').to_numpy(dtype='S')
+        charArr = np.ascontiguousarray(charArr.view(np.uint8).reshape(len(charArr), charArr.dtype.itemsize).T)
+
+        # Each byte is labelled with the index of the AD value it belongs to if it is a digit, and with 3 otherwise;
+        # the strings are padded with 0
+        digitArr = charArr - np.uint8(ord('0'))
+        fldArr = np.where(digitArr < 10, np.cumsum(charArr == ord(','), axis=0, dtype=np.uint8), np.uint8(3))
+
+        adArr = np.zeros((3, charArr.shape[1]), dtype=np.uint32)
+        for w in range(len(charArr)):
+            for j in range(min(w+1, 3)):
+                inFld = fldArr[w] == j
+                adArr[j] = np.where(inFld, adArr[j]*10 + digitArr[w], adArr[j])
+
+        # The AD values with a character other than a digit are set to 0
+        invalid = (fldArr == 3) & (charArr != ord(',')) & (charArr != 0)
+        if invalid.any():
+            fldIdx = np.cumsum(charArr == ord(','), axis=0)
+            for j in range(3):
+                adArr[j][(invalid & (fldIdx == j)).any(axis=0)] = 0
+
+        for j in range(3):
+            df[adField+str(j)] = pd.arrays.IntegerArray(adArr[j], missing.copy())
+
+    return df
+
+
+def readSNPTable(inFile, fieldL, adFieldL, chunkSize=0):
+    '''
+    Read only the fields in fieldL from the GATK4-generated tsv file, and decode the AD fields in adFieldL.
+    If chunkSize is not 0, an iterator over chunks of chunkSize rows is returned instead of the entire table
+    '''
+    dtypeDict = {'CHROM':str, 'REF':str, 'ALT':str, **{adField:str for adField in adFieldL}}
+    if chunkSize == 0:
+        return decodeAD(pd.read_csv(inFile, delimiter='\t', encoding='utf-8', usecols=fieldL, engine=csvEngine, dtype=dtypeDict), adFieldL)
+
+    # The pyarrow CSV engine does not read files in chunks
+    reader = pd.read_csv(inFile, delimiter='\t', encoding='utf-8', usecols=fieldL, dtype=dtypeDict, chunksize=chunkSize)
+    return (decodeAD(df, adFieldL) for df in reader)
+
+
+def chrmIndex(df):
+    '''
+    Index of the chromosomes built in a single groupby pass over the SNP table. The index of the dataframe is the
+    chromosome ID, and its columns are the number of SNPs (SNPs) and the largest position (MaxPOS) of each
+    chromosome, the numeric ID used to sort the chromosomes (SortID), and the rows [Start, End) of the chromosome in
+    snpDF; the last three are filled in once the chromosomes are selected and the SNPs are analyzed, and so are the
+    rows [SWStart, SWEnd) of the sliding windows of the chromosome in swDataFrame
+    '''
+    chrmIdx = df.groupby('CHROM', sort=False)['POS'].agg(SNPs='size', MaxPOS='max')
+
+    return chrmIdx.assign(SortID=0, Start=0, End=0, SWStart=0, SWEnd=0)
+
+
+def chrmSizeTable(inFile, chunkSize):
+    '''
+    Stream the CHROM and POS fields of the GATK4-generated tsv file in chunks of chunkSize rows.
+    Return the chromosome index of the file (chrmIndex), and the number of SNPs in the file
+    '''
+    idxL, numOfSNPs = [], 0
+    for df in pd.read_csv(inFile, delimiter='\t', encoding='utf-8', usecols=['CHROM', 'POS'], dtype={'CHROM':str}, chunksize=chunkSize):
+        idxL.append(chrmIndex(df))
+        numOfSNPs += len(df.index)
+
+    chrmIdx = pd.concat(idxL).groupby(level=0, sort=False).agg({'SNPs':'sum', 'MaxPOS':'max'})
+    chrmIdx = chrmIdx.assign(SortID=0, Start=0, End=0, SWStart=0, SWEnd=0)
+
+    return [chrmIdx, numOfSNPs]
+
+
+def partitionFile(chrmID):
+    return os.path.join(partitionPath, f'{chrmID}.csv')
+
+
+def partitionDir(chrmID):
+    # The post-Fisher SNPs of a chromosome are saved in its entry of the stage cache
+    return fisherDirs[chrmID]
+
+
+def saveSNPCache(df, cacheDir, pColL):
+    '''
+    Save the post-Fisher SNP table as a directory of .npy files, one for each column. The string columns are
+    saved as categorical codes and categories, the p-value columns in pColL as float64, and the other columns, which
+    contain positions, reads, and quality scores, as the smallest unsigned integer type holding their values.
+    cacheDir is the build directory of a stage entry, which may hold other files of the entry
+    '''
+    os.makedirs(cacheDir, exist_ok=True)
+
+    for j, colName in enumerate(df.columns):
+        colS = df[colName]
+        if colName in pColL:
+            np.save(os.path.join(cacheDir, f'{j}.npy'), colS.to_numpy(dtype=np.float64))
+        elif pd.api.types.is_numeric_dtype(colS) and len(colS.index) > 0 and colS.min() >= 0 and (colS % 1 == 0).all():
+            np.save(os.path.join(cacheDir, f'{j}.npy'), colS.to_numpy().astype(np.min_scalar_type(int(colS.max()))))
+        elif pd.api.types.is_numeric_dtype(colS):
+            np.save(os.path.join(cacheDir, f'{j}.npy'), colS.to_numpy())
+        else:
+            colCat = pd.Categorical(colS.astype(str))
+            np.save(os.path.join(cacheDir, f'{j}.npy'), colCat.codes)
+            np.save(os.path.join(cacheDir, f'{j}.categories.npy'), colCat.categories.to_numpy(dtype=str))
+
+    np.save(os.path.join(cacheDir, 'columns.npy'), np.array(df.columns.tolist(), dtype=str))
+
+
+def loadSNPCache(cacheDir, colL=None):
+    '''
+    Load the columns in colL, or all the columns, of a SNP table saved by saveSNPCache. The .npy files are memory
+    mapped, so only the loaded columns are read from the disk; the columns of the dataframe are not copied, so they
+    share the read-only memory maps
+    '''
+    cacheColL = np.load(os.path.join(cacheDir, 'columns.npy')).tolist()
+    colDict = {}
+    for colName in (cacheColL if colL is None else colL):
+        j = cacheColL.index(colName)
+        colArr = np.load(os.path.join(cacheDir, f'{j}.npy'), mmap_mode='r')
+        if os.path.isfile(os.path.join(cacheDir, f'{j}.categories.npy')):
+            colDict[colName] = pd.Categorical.from_codes(colArr, categories=np.load(os.path.join(cacheDir, f'{j}.categories.npy')))
+        else:
+            colDict[colName] = colArr
+
+    return pd.DataFrame(colDict, copy=False)
+
+
+def chrmFingerprints(inFile, fieldL):
+    '''
+    Content hash of the fields in fieldL of the SNPs of each chromosome, calculated from the hashes of the rows in the
+    order of the input file, which is read chunkSize rows at a time if '--chunksize' is given. The hashes are saved in
+    the stage cache along with the size and the modification time of the file, so the file is hashed again only if it
+    is changed.
+    Return a dictionary with the chromosome IDs as its keys and the hashes as its values
+    '''
+    fileStat = os.stat(inFile)
+    filePrefix = os.path.abspath(inFile) + ':'
+    statKey = f'{filePrefix}{fileStat.st_size}:{fileStat.st_mtime_ns}:{",".join(fieldL)}'
+    digestFile = os.path.join(cachePath, 'digests.json')
+
+    digestDict = {}
+    if os.path.isfile(digestFile):
+        with open(digestFile, 'r') as du:
+            digestDict = json.load(du)
+
+    if statKey not in digestDict:
+        hashDict = {}
+        for df in pd.read_csv(inFile, delimiter='\t', encoding='utf-8', usecols=fieldL, dtype=str, chunksize=chunkSize if chunkSize > 0 else 2**20):
+            rowHashArr = pd.util.hash_pandas_object(df[fieldL], index=False).to_numpy()
+            for chrmID, idxArr in df.groupby('CHROM', sort=False).indices.items():
+                hashDict.setdefault(chrmID, hashlib.blake2b(digest_size=20)).update(rowHashArr[idxArr].tobytes())
+
+        # Hashes of the previous versions of the file are no longer needed
+        digestDict = {k: v for k, v in digestDict.items() if not k.startswith(filePrefix)}
+        digestDict[statKey] = {chrmID: chrmHash.hexdigest() for chrmID, chrmHash in hashDict.items()}
+        with open(f'{digestFile}.{os.getpid()}', 'w') as xie:
+            json.dump(digestDict, xie)
+        os.replace(f'{digestFile}.{os.getpid()}', digestFile)
+
+    return digestDict[statKey]
+
+
+def stageKey(stage, paramDict):
+    # The entry of a pipeline stage is identified by the stage name and a hash of the parameters it depends on,
+    # including the key of the stage it is derived from
+    return stage + '-' + hashlib.blake2b(json.dumps(paramDict, sort_keys=True).encode(), digest_size=10).hexdigest()
+
+
+def stageDir(key):
+    return os.path.join(cachePath, key)
+
+
+def stageBuildDir(key):
+    # A stage entry is built in a temporary directory, which is renamed once the stage is completed
+    buildDir = os.path.join(cachePath, f'{key}.tmp{os.getpid()}')
+    if os.path.exists(buildDir):
+        shutil.rmtree(buildDir)
+    os.makedirs(buildDir)
+
+    return buildDir
+
+
+def stageLoad(key):
+    '''
+    Return the results saved in the entry of a completed stage, or None if the stage needs to be calculated. The entry
+    is marked as used, so it is not evicted in this run and is the last to be evicted in later runs
+    '''
+    metaFile = os.path.join(stageDir(key), 'meta.json')
+    if not os.path.isfile(metaFile):
+        return None
+
+    os.utime(metaFile)
+    usedStages.add(key)
+    with open(metaFile, 'r') as du:
+        return json.load(du)['results']
+
+
+def stageSave(key, paramDict, results, buildDir=None):
+    '''
+    Complete the entry of a stage by saving its parameters and results in meta.json and moving the build directory to
+    its place in the stage cache. If another run has completed the same entry in the meantime, the existing entry is
+    kept. Return the directory of the entry
+    '''
+    if buildDir is None:
+        buildDir = stageBuildDir(key)
+
+    with open(os.path.join(buildDir, 'meta.json'), 'w') as xie:
+        json.dump({'parameters': paramDict, 'results': results}, xie, indent=1, default=lambda x: x.tolist())
+
+    try:
+        os.rename(buildDir, stageDir(key))
+    except OSError:
+        shutil.rmtree(buildDir)
+
+    usedStages.add(key)
+    cacheEviction()
+
+    return stageDir(key)
+
+
+def cacheEviction():
+    '''
+    Remove the least recently used entries of the stage cache until its size is within cacheBudget. Entries used in
+    this run are kept, and the build directories of other runs are removed only if they are not modified for a day
+    '''
+    if cacheBudget == 0:
+        return
+
+    entryL, totalSize = [], 0
+    for entry in os.scandir(cachePath):
+        if not entry.is_dir() or entry.name in usedStages:
+            continue
+
+        # The build directories of other processes can be renamed or removed while the cache is scanned
+        try:
+            entrySize = sum(os.path.getsize(os.path.join(root, f)) for root, __, fileL in os.walk(entry.path) for f in fileL)
+
+            metaFile = os.path.join(entry.path, 'meta.json')
+            if os.path.isfile(metaFile):
+                entryL.append([os.path.getmtime(metaFile), entrySize, entry.path])
+            elif time.time() - entry.stat().st_mtime > 86400:
+                entryL.append([0, entrySize, entry.path])
+        except FileNotFoundError:
+            continue
+
+        totalSize += entrySize
+
+    for key in usedStages:
+        totalSize += sum(os.path.getsize(os.path.join(root, f)) for root, __, fileL in os.walk(stageDir(key)) for f in fileL)
+
+    for lastUse, entrySize, entryPath in sorted(entryL):
+        if totalSize <= cacheBudget:
+            break
+
+        shutil.rmtree(entryPath, ignore_errors=True)
+        totalSize -= entrySize
+
+
+def keySeedSeq(seedSeq, key):
+    # The random number stream derived from seedSeq and a hash of key, a bytes object
+    keyHash = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+    return np.random.SeedSequence(seedSeq.entropy, spawn_key=seedSeq.spawn_key + (keyHash,))
+
+
+def chrmSeedSeq(seedSeq, chrmID):
+    # The random number stream of a chromosome is derived from seedSeq and the chromosome ID, so the results of a
+    # chromosome are the same whether or not the other chromosomes are recalculated
+    return keySeedSeq(seedSeq, chrmID.encode())
+
+
+def qualityFiltering(df):
+    # Remove SNPs with calculation-generated 'NA' value(s); SNPs with a low genotype quality score are removed by
+    # snpFiltering before any statistics are calculated
+    return df.dropna()
+
+
+def chrmSNPs(chrmID):
+    '''
+    The SNPs of a chromosome sorted by position. If the input file was ingested in chunks, they are read from the
+    partition of the chromosome, otherwise they are selected from snpDF
+    '''
+    if chunkSize == 0:
+        return snpDF.iloc[chrmIdx.at[chrmID, 'Start']:chrmIdx.at[chrmID, 'End']]
+
+    return qualityFiltering(loadSNPCache(partitionDir(chrmID))).sort_values('POS', kind='stable')
+
+
+def regionBounds(posArr, startArr, endArr):
+    '''
+    Rows [lo, hi) of the genomic regions [start, end] in posArr, the sorted positions of the SNPs or the start points
+    of the sliding windows of a chromosome. startArr and endArr can be numbers or arrays, so many regions are located
+    with a single binary search
+    '''
+    return np.searchsorted(posArr, startArr, 'left'), np.searchsorted(posArr, endArr, 'right')
+
+
+def chrmSWs(chrmID):
+    # The sliding windows of a chromosome, a slice of swDataFrame
+    return swDataFrame.iloc[chrmIdx.at[chrmID, 'SWStart']:chrmIdx.at[chrmID, 'SWEnd']]
+
+
+def chrmFiltering(chromosomeList):
     # Many reference genomes contain unmapped fragments that tend to be small and are not informative to SNP-trait association, filtering them out makes the chromosome list more readable 
     # Additionally, users may enter wrong chromosome names that could lead to unexpected behaviors 
     chrmSizeL, smallOrWrongChrmL = [], []
     for chrmID in chromosomeList:
         # Handle the case in which a wrong chromosome name was entered by the user
-        if chrmID in chrmRawList:
-            chrmSize = df[df.CHROM==chrmID]['POS'].max()
+        if chrmID in chrmIdx.index:
+            chrmSize = chrmIdx.at[chrmID, 'MaxPOS']
         else:
             smallOrWrongChrmL.append(chrmID)
             continue
@@ -55,385 +475,1065 @@ def chrmFiltering(df, chromosomeList):
         else:
             chrmSizeL.append(chrmSize)
 
-    for chrmID in smallOrWrongChrmL:
-        chromosomeList.remove(chrmID)
+    smallOrWrongChrmS = set(smallOrWrongChrmL)
+    chromosomeList[:] = [chrmID for chrmID in chromosomeList if chrmID not in smallOrWrongChrmS]
 
     return [chrmSizeL, chromosomeList]
 
 
-def snpFiltering(df):
-    print('Perform SNP filtering')
-    global snpDF, misc
+def writeTable(df, outFile, append=False):
+    # Save df as a csv file, compressed if the name of the file ends with '.gz' or '.zst'; the header is written only
+    # if the file is created
+    header = not (append == True and os.path.isfile(outFile))
+    df.to_csv(outFile, index=None, mode='a' if append == True else 'w', header=header)
+
+
+def writeCodes(recArr, outFile):
+    with open(outFile, 'ab') as xie:
+        recArr.tofile(xie)
+
+
+def queueOutput(outFile, func, *args):
+    '''
+    Queue func(*args), which writes outFile, to the background writer threads. All the writes of a file are executed
+    by the same thread in the order they are queued, so a file can be appended chunk by chunk
+    '''
+    while len(outputFutures) >= outputMaxPending:
+        outputFutures.pop(0).result()
 
-    df = df.copy()
+    outputFutures.append(outputPools[hash(outFile) % len(outputPools)].submit(func, *args))
 
-    # Identify unmapped SNPs
-    df_Unmapped = df[~df.CHROM.isin(chrmIDL)]
-    df_Unmapped.to_csv(os.path.join(filteringPath, 'unmapped.csv'), index=None)
 
-    # Remove unmapped SNPs
-    df = df[df.CHROM.isin(chrmIDL)]
+def outputWait():
+    # Wait for the queued writes to be completed, and raise the exception of any failed write
+    while outputFutures != []:
+        outputFutures.pop(0).result()
 
-    # Identify SNPs with 'NA' value(s)
-    df_NA = df[df.isnull().any(axis=1)]
-    df_NA.to_csv(os.path.join(filteringPath, 'na.csv'), index=None)
 
-    # Remove SNPs with 'NA' value(s)
-    df.dropna(inplace=True)
-    misc.append(['Number of SNPs after NA drop', len(df.index)])
+def resultFile(fileName):
+    # Path of a result table in the format set with '--resultformat'
+    return os.path.join(results, fileName + fmtExt[resultFormat])
 
-    # Identify SNPs with a single ALT allele
-    df_1ALT = df[~df['ALT'].str.contains(',')]
 
-    # Identify one-ALT SNPs with zero REF read in both bulks
-    df_1ALT_Fake = df_1ALT[(df_1ALT[fb_AD].str.split(',',expand=True)[0]=='0') & \
-        (df_1ALT[sb_AD].str.split(',',expand=True)[0]=='0')]
-    df_1ALT_Fake.to_csv(os.path.join(filteringPath, '1altFake.csv'), index=None)
+def filteredCSV(df, fileName):
+    # The filtered SNPs are appended to the file in the folder of their chromosome in filteredDirs, the unmapped SNPs
+    # to the file in the FilteredSNPs folder; the file of a category is created even if no SNP of the chromosome falls
+    # in it. The files are written in the background in the format set with '--filteredformat'
+    if filteredFormat == 'codes':
+        return
 
-    # Remove one-ALT SNPs with zero REF read in both bulks
-    df_1ALT_Real = df_1ALT[~((df_1ALT[fb_AD].str.split(',',expand=True)[0]=='0') & \
-        (df_1ALT[sb_AD].str.split(',',expand=True)[0]=='0'))]
-    df_1ALT_Real.to_csv(os.path.join(filteringPath, '1altReal.csv'), index=None)
+    if fileName == 'unmapped.csv':
+        outFile = os.path.join(filteringPath, fileName + fmtExt[filteredFormat])
+        queueOutput(outFile, writeTable, df, outFile, True)
+        return
 
-    # Identify SNPs with more than one ALT allele
-    df_mALT = df[df['ALT'].str.contains(',')]
+    groupDict = df.groupby('CHROM', sort=False).indices
+    for chrmID, chrmDir in filteredDirs.items():
+        outFile = os.path.join(chrmDir, fileName + fmtExt[filteredFormat])
+        if chrmID in groupDict or outFile not in filteredFiles:
+            filteredFiles.add(outFile)
+            queueOutput(outFile, writeTable, df.iloc[groupDict.get(chrmID, [])], outFile, True)
 
-    # Identify SNPs with two ALT alleles. Split ALT with ',' once, and the second element should not contain a ','
-    df_2ALT = df_mALT[~df_mALT['ALT'].str.split(',', n=1, expand=True)[1].str.contains(',')]
 
-    # A two-ALT SNP is a real SNP if the REF read is zero in both bulks
-    # Making a copy to suppress the warning message. Updating the AD values of these SNPs is required
-    df_2ALT_Real = df_2ALT[(df_2ALT[fb_AD].str.split(',',expand=True)[0]=='0') & \
-        (df_2ALT[sb_AD].str.split(',',expand=True)[0]=='0')].copy()
+def filteredCodes(df, code):
+    '''
+    Record the filtered SNPs as their row numbers in the input file and the codes of their categories instead of
+    their fields. The records are appended to the file 'filterCodes.bin' in the folder of their chromosome in
+    filteredDirs, or in the FilteredSNPs folder if the SNPs are unmapped, and can be read with np.fromfile(fileName, dtype=filterCodeDtype)
+    '''
+    filtered = np.flatnonzero(code > 0)
+    recArr = np.empty(len(filtered), dtype=filterCodeDtype)
+    recArr['row'], recArr['code'] = df.index.to_numpy()[filtered], code[filtered]
 
-    # Update the AD values of the above SNPs by removing the REF read which is zero
-    df_2ALT_Real[fb_AD] = df_2ALT_Real[fb_AD].str.slice(start=2)
-    df_2ALT_Real[sb_AD] = df_2ALT_Real[sb_AD].str.slice(start=2)
-    df_2ALT_Real.to_csv(os.path.join(filteringPath, '2altReal.csv'), index=None)
+    unmapped = recArr['code'] == snpCategories.index('Unmapped')
+    outFile = os.path.join(filteringPath, 'filterCodes.bin')
+    queueOutput(outFile, writeCodes, recArr[unmapped], outFile)
 
-    # The two-ALT SNP may be cuased by allele heterozygosity if the REF read in not zero
-    # Repetitive sequences in the genome or sequencing artifacts are other possibilities
-    df_2ALT_Het = df_2ALT[~((df_2ALT[fb_AD].str.split(',',expand=True)[0]=='0') & \
-        (df_2ALT[sb_AD].str.split(',',expand=True)[0]=='0'))]
+    recArr, chrmArr = recArr[~unmapped], df['CHROM'].to_numpy()[filtered][~unmapped]
+    for chrmID, idxArr in pd.Series(chrmArr).groupby(chrmArr, sort=False).indices.items():
+        outFile = os.path.join(filteredDirs[chrmID], 'filterCodes.bin')
+        queueOutput(outFile, writeCodes, recArr[idxArr], outFile)
 
-    # Identify SNPs with three or more ALT alleles
-    df_3omALT = df_mALT[df_mALT['ALT'].str.split(',', n=1, expand=True)[1].str.contains(',')]
 
-    snpDF_Het = pd.concat([df_3omALT, df_2ALT_Het])
-    snpDF_Het.to_csv(os.path.join(filteringPath, 'heterozygousLoci.csv'), index=None)
+def filteredLink(chrmID):
+    '''
+    The filtered SNPs of a chromosome are saved in its stage entry of SNP filtering and Fisher's exact test, so they
+    are reused and evicted with it. The folder of the chromosome in the FilteredSNPs folder is replaced with hard links
+    to them (or copies if the file system does not support hard links), so it holds the filtered SNPs of this run.
+    The batch jobs of an input file may replace the folder at the same time, so the links are made in a directory of
+    this process and swapped in by renaming; if another job has just replaced the folder, its links are kept
+    '''
+    srcDir, dstDir = os.path.join(fisherDirs[chrmID], 'FilteredSNPs'), os.path.join(filteringPath, chrmID)
+    tmpDir, oldDir = f'{dstDir}.tmp{os.getpid()}', f'{dstDir}.old{os.getpid()}'
+    for leftDir in [tmpDir, oldDir]:
+        shutil.rmtree(leftDir, ignore_errors=True)
 
-    # Concatenate 1ALT_Real and 2ALT_Real
-    snpDF = pd.concat([df_1ALT_Real, df_2ALT_Real])
+    try:
+        shutil.copytree(srcDir, tmpDir, copy_function=os.link)
+    except OSError:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        shutil.copytree(srcDir, tmpDir)
+
+    try:
+        os.rename(dstDir, oldDir)
+    except FileNotFoundError:
+        pass
 
-    # In case the input file contains Indels
     try:
-        # Identify inDels, REF/Alt allele with more than 1 base
-        df_InDel = snpDF[(snpDF['REF'].str.len()>1) | (snpDF['ALT'].str.split(',', expand=True)[0].str.len()>1) | \
-        (snpDF['ALT'].str.split(',', expand=True)[1].str.len()>1)]
+        os.rename(tmpDir, dstDir)
+    except OSError:
+        shutil.rmtree(tmpDir, ignore_errors=True)
 
-        # Create the SNP dataframe
-        snpDF = snpDF[~((snpDF['REF'].str.len()>1) | (snpDF['ALT'].str.split(',', expand=True)[0].str.len()>1) | \
-        (snpDF['ALT'].str.split(',', expand=True)[1].str.len()>1))]
+    shutil.rmtree(oldDir, ignore_errors=True)
 
-    except KeyError:
-        print('All the ALT loci contain only one allele')
-        # Identify inDels, REF/Alt allele with more than 1 base
-        df_InDel = snpDF[(snpDF['REF'].str.len()>1) | (snpDF['ALT'].str.len()>1)]
 
-        # Create the SNP dataframe
-        snpDF = snpDF[~((snpDF['REF'].str.len()>1) | (snpDF['ALT'].str.len()>1))]
+def snpFiltering(df):
+    '''
+    The ALT and AD fields are parsed once into numeric arrays, and each SNP is assigned the code of the first
+    filtering rule it fails (snpCategories), or 0 if it passes all of them. The filtered SNPs are appended to the
+    files of their categories (filteredCSV), and the REF reads, ALT reads, and locus depth of each bulk
+    are added to snpDF.
+    Return a dictionary with the IDs of the selected chromosomes as its keys and the number of SNPs of the chromosome
+    in each category as its values
+    '''
+    global snpDF
+
+    code = np.zeros(len(df.index), dtype=np.int8)
+
+    # Unmapped SNPs, and SNPs with 'NA' value(s)
+    mapped = df['CHROM'].isin(chrmIDL).to_numpy()
+    code[~mapped] = snpCategories.index('Unmapped')
+    code[mapped & df.isnull().any(axis=1).to_numpy()] = snpCategories.index('NA')
+    valid = np.flatnonzero(code==0)
+
+    # Number of ALT alleles, and the lengths of the REF allele and the first two ALT alleles
+    altS = df['ALT'].iloc[valid]
+    numOfALT = altS.str.count(',').to_numpy() + 1
+    altFlds = altS.str.split(',', n=2, expand=True)
+    alleleLen = [df['REF'].iloc[valid].str.len().to_numpy()]
+    alleleLen.extend(altFlds[j].str.len().fillna(0).to_numpy() if j in altFlds.columns else np.zeros(len(valid)) for j in [0, 1])
+    inDel = np.maximum.reduce(alleleLen) > 1
+
+    # The first three AD values of each bulk, decoded when the input file was read
+    refZero, adL = np.ones(len(valid), dtype=bool), []
+    for bulkAD in [fb_AD, sb_AD]:
+        adL.append([df[bulkAD+str(j)].iloc[valid].to_numpy(dtype=np.int64) for j in range(3)])
+        refZero &= adL[-1][0] == 0
+
+    # A one-ALT SNP with zero REF read in both bulks is fake; a two-ALT SNP is a real SNP if the REF read is zero in
+    # both bulks, otherwise it may be caused by allele heterozygosity, repetitive sequences, or sequencing artifacts
+    fake1ALT = (numOfALT==1) & refZero
+    real1ALT = (numOfALT==1) & ~refZero
+    real2ALT = (numOfALT==2) & refZero
+
+    # The reads of the two ALT alleles of a real two-ALT SNP are used as its REF/ALT reads
+    readL = []
+    for bulkADL in adL:
+        readL.append(np.where(real2ALT, bulkADL[1], bulkADL[0]))
+        readL.append(np.where(real2ALT, bulkADL[2], bulkADL[1]))
+    fbLD, sbLD = readL[0] + readL[1], readL[2] + readL[3]
+
+    # The filter plan: the filtering rules in the order they are applied, each with its category and the SNPs failing
+    # it. All the rules are evaluated at once, before Fisher's exact test and the simulation. A SNP is considered to be
+    # from repetitive sequences if its locus depth is greater than maxLD in either bulk
+    highGQ = (df[fb_GQ].iloc[valid].to_numpy(dtype=np.float64) >= minGQ) & (df[sb_GQ].iloc[valid].to_numpy(dtype=np.float64) >= minGQ)
+    filterPlan = [('1altFake', fake1ALT), ('Heterozygous', ~(real1ALT | real2ALT)), ('InDel', inDel), ('Repetitive', (fbLD>maxLD) | (sbLD>maxLD)),
+        ('ZeroLD', ~((fbLD>0) & (sbLD>0))), ('LowGQ', ~highGQ)]
+    code[valid] = np.select([ruleArr for __, ruleArr in filterPlan], [snpCategories.index(ctgr) for ctgr, __ in filterPlan], default=0)
+
+    if filteredFormat == 'codes':
+        filteredCodes(df, code)
+
+    filteredCSV(df[code==snpCategories.index('Unmapped')], 'unmapped.csv')
+    filteredCSV(df[code==snpCategories.index('NA')], 'na.csv')
+    filteredCSV(df[code==snpCategories.index('1altFake')], '1altFake.csv')
+    filteredCSV(df.iloc[valid[real1ALT]], '1altReal.csv')
+    filteredCSV(df[code==snpCategories.index('Heterozygous')], 'heterozygousLoci.csv')
+
+    # The real SNPs; the AD values of the real two-ALT SNPs are updated by removing the REF read which is zero
+    realIdx = np.flatnonzero(real1ALT | real2ALT)
+    realDF = df.iloc[valid[realIdx]].copy()
+    shifted = real2ALT[realIdx]
+    for bulkAD in [fb_AD, sb_AD]:
+        for j in range(3):
+            realDF[bulkAD+str(j)] = np.where(shifted, realDF[bulkAD+str(j+1)] if j < 2 else 0, realDF[bulkAD+str(j)])
+    filteredCSV(realDF[shifted], '2altReal.csv')
+
+    realCode = code[valid[realIdx]]
+    filteredCSV(realDF[realCode==snpCategories.index('InDel')], 'InDel.csv')
+
+    # Add the REF reads, ALT reads, and locus reads of each SNP; the SNP dataframe consists of the SNPs passing all
+    # the filtering rules, and the SNPs filtered out by the rules based on these values are saved with them
+    for colName, colArr in zip([fb_AD_REF, fb_AD_ALT, fb_LD, sb_AD_REF, sb_AD_ALT, sb_LD], [readL[0], readL[1], fbLD, readL[2], readL[3], sbLD]):
+        realDF[colName] = colArr[realIdx]
+
+    sortIdx = np.lexsort((realDF['POS'].to_numpy(), realDF['ChrmSortID'].to_numpy()))
+    realDF, realCode = realDF.iloc[sortIdx], realCode[sortIdx]
+
+    filteredCSV(realDF[realCode==snpCategories.index('Repetitive')], 'repetitiveSeq.csv')
+    filteredCSV(realDF[realCode==snpCategories.index('ZeroLD')], '0ld.csv')
+    filteredCSV(realDF[realCode==snpCategories.index('LowGQ')], 'lowGQ.csv')
+
+    snpDF = realDF[realCode==0].copy()
+
+    ctgrDict = {}
+    for chrmID, idxArr in df.groupby('CHROM', sort=False).indices.items():
+        if chrmID in chrmIDL:
+            ctgrDict[chrmID] = np.bincount(code[idxArr], minlength=len(snpCategories))
+
+    return ctgrDict
+
+
+def feTest(df, chrmRNG):
+    '''
+    Simulate the REF/ALT reads of each SNP under the null hypothesis with the random number generator chrmRNG, and
+    perform Fisher's exact test using the AD values and the simulated AD values of each SNP. Return the dataframe
+    with the reorganized columns
+    '''
+    # Calculate simulated ALT reads for each SNP under null hypothesis
+    df[sm_fb_AD_ALT] = chrmRNG.binomial(df[fb_LD], fb_Freq)
+    df[sm_fb_AD_REF] = df[fb_LD] - df[sm_fb_AD_ALT]
+    df[sm_sb_AD_ALT] = chrmRNG.binomial(df[sb_LD], sb_Freq)
+    df[sm_sb_AD_REF] = df[sb_LD] - df[sm_sb_AD_ALT]
 
-    df_InDel.to_csv(os.path.join(filteringPath, 'InDel.csv'), index=None)
+    # Create new columns for Fisher's exact test P-values and simulated P-values
+    fb_AD_ALT_Arr = df[fb_AD_ALT].to_numpy(dtype=np.uint)
+    fb_AD_REF_Arr = df[fb_AD_REF].to_numpy(dtype=np.uint)
+    sb_AD_ALT_Arr = df[sb_AD_ALT].to_numpy(dtype=np.uint)
+    sb_AD_REF_Arr = df[sb_AD_REF].to_numpy(dtype=np.uint)
 
-    snpDF.sort_values(['ChrmSortID', 'POS'], inplace=True)
+    df['FE_P'] = fisherP(fb_AD_ALT_Arr, fb_AD_REF_Arr, sb_AD_ALT_Arr, sb_AD_REF_Arr)
+    # df['FE_OR'] = (fb_AD_ALT_Arr * sb_AD_REF_Arr) / (fb_AD_REF_Arr * sb_AD_ALT_Arr)
 
-    print(f'SNP filtering completed, time elapsed: {(time.time()-t0)/60} minutes')
+    sm_fb_AD_ALT_Arr = df[sm_fb_AD_ALT].to_numpy(dtype=np.uint)
+    sm_fb_AD_REF_Arr = df[sm_fb_AD_REF].to_numpy(dtype=np.uint)
+    sm_sb_AD_ALT_Arr = df[sm_sb_AD_ALT].to_numpy(dtype=np.uint)
+    sm_sb_AD_REF_Arr = df[sm_sb_AD_REF].to_numpy(dtype=np.uint)
 
+    df['sm_FE_P'] = fisherP(sm_fb_AD_ALT_Arr, sm_fb_AD_REF_Arr, sm_sb_AD_ALT_Arr, sm_sb_AD_REF_Arr)
+    # df['sm_FE_OR'] = (sm_fb_AD_ALT_Arr * sm_sb_AD_REF_Arr) / (sm_fb_AD_REF_Arr * sm_sb_AD_ALT_Arr)
 
-def statistics(row):
-    # Perform Fisher's exact test for each SNP using the actual REF/ALT reads
-    try:
-        fe = fisher_exact([[row[fb_AD_REF], row[fb_AD_ALT]], [row[sb_AD_REF], row[sb_AD_ALT]]])
-    except TypeError:
-        fe = ('NA', 'NA')
+    # Remove unnecessary columns and reorgnaize the columns
+    reorderColumns = ['CHROM', 'POS', 'REF', 'ALT', fb_AD_REF, fb_AD_ALT, fb_LD, sm_fb_AD_ALT, fb_GQ, sb_AD_REF, sb_AD_ALT, sb_LD, sm_sb_AD_ALT, sb_GQ, 'FE_P', 'sm_FE_P']
 
-    # Perform Fisher's exact test for each SNP using the simulated REF/ALT reads
-    try:
-        sm_FE = fisher_exact([[row[sm_fb_AD_REF], row[sm_fb_AD_ALT]], [row[sm_sb_AD_REF], row[sm_sb_AD_ALT]]])
-    except TypeError:
-        sm_FE = ('NA', 'NA')
+    return df[reorderColumns]
 
-    return [fe, sm_FE]
 
+def lnFactorial(n):
+    '''
+    Return a cached table of ln(k!) for k in the range of [0, n]. The table is extended when a larger n is requested
+    '''
+    global lnFactArr
+    if len(lnFactArr) <= n:
+        from scipy.special import gammaln
+        lnFactArr = gammaln(np.arange(max(n+1, 2*len(lnFactArr)), dtype=np.float64) + 1)
 
-# Using this function for the calculation of the threshold if 'fisher' is not available
-def smThresholds_proximal(DF):
-    print('Calculate the threshold of sSNPs/totalSNPs.')
-    ratioLi = []
-    for __ in range(rep):
-        sm_SNP_SMPL = DF.sample(snpPerSW, replace=True)
-        sm_sSNP_SMPL = sm_SNP_SMPL[sm_SNP_SMPL['sm_FE_P']<smAlpha]
+    return lnFactArr
 
-        ratioLi.append(len(sm_sSNP_SMPL.index)/snpPerSW)
 
-    misc.append(['Genome-wide sSNP/totalSNP ratio threshold', np.percentile(ratioLi, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])])
-    print(f'Threshold calculation completed, time elapsed: {(time.time()-t0)/60} minutes')
+def fisherExact_npy(a_Arr, b_Arr, c_Arr, d_Arr):
+    '''
+    Batched Fisher's exact test of the 2x2 tables [[a, b], [c, d]], a drop-in replacement of 'pvalue_npy' of the
+    module 'fisher'. With fixed margins, 'a' follows the hypergeometric distribution; the p-values are sums of its
+    probability mass function over the support, calculated with a cached log-factorial table. The tables are
+    grouped by the size of the support to bound the size of the intermediate matrices.
+    Return the left-tail, right-tail, and two-tail p-values
+    '''
+    a, b, c, d = [np.asarray(arr, dtype=np.int64).ravel() for arr in [a_Arr, b_Arr, c_Arr, d_Arr]]
+    n1, n2, k = a + b, c + d, a + c
+    n = n1 + n2
+
+    leftP, rightP, twoP = np.ones(len(a)), np.ones(len(a)), np.ones(len(a))
+    if len(a) == 0:
+        return leftP, rightP, twoP
+
+    lnF = lnFactorial(int(n.max()))
+
+    # ln(P(x)) = lnC - ln(x!) - ln((n1-x)!) - ln((k-x)!) - ln((n2-k+x)!)
+    lnC = lnF[n1] + lnF[n2] + lnF[k] + lnF[n-k] - lnF[n]
+    lnPa = lnC - lnF[a] - lnF[b] - lnF[c] - lnF[d]
+    xMin, xMax = np.maximum(0, k-n2), np.minimum(n1, k)
+    supLen = xMax - xMin + 1
+
+    # Tables whose support contains a single value have p-values of 1
+    bucket = np.ceil(np.log2(supLen)).astype(np.int64)
+    for bkt in np.unique(bucket[supLen>1]):
+        width = 2**int(bkt)
+        rows = np.flatnonzero(bucket==bkt)
+
+        for start in range(0, len(rows), max(1, feBlockSize//width)):
+            r = rows[start:start+max(1, feBlockSize//width)]
+            x = xMin[r, None] + np.arange(width)
+            valid = x <= xMax[r, None]
+            x = np.minimum(x, xMax[r, None])
+
+            lnP = lnC[r, None] - lnF[x] - lnF[n1[r, None]-x] - lnF[k[r, None]-x] - lnF[n2[r, None]-k[r, None]+x]
+            pmf = np.where(valid, np.exp(lnP), 0.0)
+
+            leftP[r] = np.where(x<=a[r, None], pmf, 0.0).sum(axis=1)
+            rightP[r] = np.where(x>=a[r, None], pmf, 0.0).sum(axis=1)
+
+            # Two-tail: the sum of the probabilities not greater than that of the observed table. The relative
+            # tolerance handles the rounding error of tables with equal probabilities
+            twoP[r] = np.where(lnP<=lnPa[r, None]+feRelTol, pmf, 0.0).sum(axis=1)
+
+    return np.minimum(leftP, 1.0), np.minimum(rightP, 1.0), np.minimum(twoP, 1.0)
+
+
+def cacheLookup(cache, keyArr):
+    '''
+    Return the cached values of the sorted unique keys in keyArr, NaN if a key is not in the cache
+    '''
+    valArr = np.full(len(keyArr), np.nan)
+    if len(cache['keys']) == 0:
+        return valArr
+
+    pos = np.minimum(np.searchsorted(cache['keys'], keyArr), len(cache['keys'])-1)
+    found = cache['keys'][pos] == keyArr
+    valArr[found] = cache['vals'][pos[found]]
+    cache['hits'][pos[found]] += 1
+
+    return valArr
+
+
+def cacheUpdate(cache, keyArr, valArr):
+    '''
+    Add the sorted unique keys that are not in the cache. If the cache is full, only the half of the entries with
+    the most hits are kept
+    '''
+    pos = np.searchsorted(cache['keys'], keyArr)
+    cache['keys'] = np.insert(cache['keys'], pos, keyArr)
+    cache['vals'] = np.insert(cache['vals'], pos, valArr)
+    cache['hits'] = np.insert(cache['hits'], pos, 0)
+
+    if len(cache['keys']) > cache['size']:
+        kept = np.sort(np.argsort(cache['hits'], kind='stable')[-(cache['size']//2):])
+        cache['keys'], cache['vals'] = cache['keys'][kept], cache['vals'][kept]
+        cache['hits'] = np.zeros(len(kept), dtype=np.uint64)
+
+
+def fisherCaches():
+    # feCache and the caches of critCache, by name
+    return {'fe': feCache, **{('crit', sigAlpha): cache for sigAlpha, cache in critCache.items()}}
+
+
+def critCacheOf(sigAlpha):
+    # The cache of the non-rejection intervals at the significance level sigAlpha
+    return critCache.setdefault(sigAlpha, {'keys': np.zeros(0, dtype=np.uint64), 'vals': np.zeros(0), 'hits': np.zeros(0, dtype=np.uint64), 'size': 2**20})
+
+
+def cacheAdded(keyDict):
+    '''
+    The entries of feCache and critCache whose keys are not in keyDict, the keys of the caches by name at an earlier
+    point. Return a dictionary with the names of the caches as its keys and the (keys, values) of the entries as its
+    values
+    '''
+    addedDict = {}
+    for name, cache in fisherCaches().items():
+        oldKeyArr = keyDict.get(name, np.zeros(0, dtype=np.uint64))
+        if len(oldKeyArr) == 0:
+            added = np.ones(len(cache['keys']), dtype=bool)
+        else:
+            added = oldKeyArr[np.minimum(np.searchsorted(oldKeyArr, cache['keys']), len(oldKeyArr)-1)] != cache['keys']
+        addedDict[name] = (cache['keys'][added], cache['vals'][added])
+
+    return addedDict
+
+
+def cacheMerge(addedDict):
+    # Add the cache entries returned by cacheAdded in a worker process to the caches of this process
+    for name, (keyArr, valArr) in addedDict.items():
+        cache = feCache if name == 'fe' else critCacheOf(name[1])
+        if len(cache['keys']) > 0:
+            new = cache['keys'][np.minimum(np.searchsorted(cache['keys'], keyArr), len(cache['keys'])-1)] != keyArr
+            keyArr, valArr = keyArr[new], valArr[new]
+        if len(keyArr) > 0:
+            cacheUpdate(cache, keyArr, valArr)
+
+
+def fisherP(a_Arr, b_Arr, c_Arr, d_Arr):
+    '''
+    Two-tail p-values of Fisher's exact test of the 2x2 tables [[a, b], [c, d]]. Many SNPs share the same table at
+    the typical locus depths of BSA-Seq, especially the simulated ones. Each table is packed into a single integer
+    key, and the test is performed only for the unique tables that are not in the cache
+    '''
+    a, b, c, d = [np.asarray(arr, dtype=np.uint64).ravel() for arr in [a_Arr, b_Arr, c_Arr, d_Arr]]
+    pArr = np.empty(len(a))
+
+    # Tables with a value that cannot be packed into 16 bits are tested directly
+    packable = np.maximum(np.maximum(a, b), np.maximum(c, d)) < 2**16
+    if not packable.all():
+        __, __, pArr[~packable] = pvalue_npy(a[~packable], b[~packable], c[~packable], d[~packable])
+
+    keyArr = (a[packable]<<np.uint64(48)) | (b[packable]<<np.uint64(32)) | (c[packable]<<np.uint64(16)) | d[packable]
+    uKeyArr, invArr = np.unique(keyArr, return_inverse=True)
+
+    uPArr = cacheLookup(feCache, uKeyArr)
+    missing = np.isnan(uPArr)
+    if missing.any():
+        mKeyArr, mask = uKeyArr[missing], np.uint64(2**16-1)
+        __, __, uPArr[missing] = pvalue_npy(mKeyArr>>np.uint64(48), (mKeyArr>>np.uint64(32)) & mask, (mKeyArr>>np.uint64(16)) & mask, mKeyArr & mask)
+        cacheUpdate(feCache, mKeyArr, uPArr[missing])
+
+    pArr[packable] = uPArr[invArr.ravel()]
+
+    return pArr
+
+
+def critInterval(n1Arr, n2Arr, kArr, sigAlpha):
+    '''
+    For fixed margins, the probability of a 2x2 table is unimodal in 'a', so the tables with a two-tail p-value not
+    less than sigAlpha form an interval of 'a'. The probabilities over the support of each margin (n1, n2, k) are
+    sorted, and the p-value of each table is the cumulative sum of the probabilities up to its own, which takes
+    O(S*log(S)) for a support of size S instead of testing each table; the margins are processed in groups bounded
+    by feBlockSize.
+    Return the lower and the upper bounds of the interval of each margin
+    '''
+    n1, n2, k = [np.asarray(arr, dtype=np.int64) for arr in [n1Arr, n2Arr, kArr]]
+    xMin, xMax = np.maximum(0, k-n2), np.minimum(n1, k)
+    supLen = xMax - xMin + 1
+
+    loArr, hiArr = np.empty(len(n1), dtype=np.int64), np.empty(len(n1), dtype=np.int64)
+    if len(n1) == 0:
+        return loArr, hiArr
+
+    lnF = lnFactorial(int((n1+n2).max()))
+    lnC = lnF[n1] + lnF[n2] + lnF[k] + lnF[n1+n2-k] - lnF[n1+n2]
+
+    cumSup = np.cumsum(supLen)
+    start = 0
+    while start < len(n1):
+        base = cumSup[start] - supLen[start]
+        end = max(np.searchsorted(cumSup, base+feBlockSize*16, 'right'), start+1)
+        mIdx = np.repeat(np.arange(start, end), supLen[start:end])
+        segArr = cumSup[start:end] - supLen[start:end] - base
+        x = xMin[mIdx] + np.arange(len(mIdx)) - segArr[mIdx-start]
+        lnP = lnC[mIdx] - lnF[x] - lnF[n1[mIdx]-x] - lnF[k[mIdx]-x] - lnF[n2[mIdx]-k[mIdx]+x]
+
+        # Sort the probabilities within each margin; the probabilities within the relative tolerance feRelTol of each
+        # other are treated as equal, as in fisherExact_npy
+        order = np.lexsort((lnP, mIdx))
+        lnPSorted, pmfSorted = lnP[order], np.exp(lnP[order])
+        newGrp = np.ones(len(mIdx), dtype=bool)
+        newGrp[1:] = (lnPSorted[1:]-lnPSorted[:-1] > feRelTol) | (mIdx[1:] != mIdx[:-1])
+        grpEnd = np.append(np.flatnonzero(newGrp)[1:], len(mIdx)) - 1
+
+        cumP = np.cumsum(pmfSorted)
+        pArr = np.empty(len(mIdx))
+        pArr[order] = cumP[grpEnd[np.cumsum(newGrp)-1]] - (cumP-pmfSorted)[segArr][mIdx-start]
+
+        # A p-value within the relative tolerance of sigAlpha is treated as equal to it, so it is not significant
+        sig = pArr * np.exp(feRelTol) < sigAlpha
+        loArr[start:end] = np.minimum.reduceat(np.where(sig, xMax[mIdx]+1, x), segArr)
+        hiArr[start:end] = np.maximum.reduceat(np.where(sig, xMin[mIdx]-1, x), segArr)
+        start = end
+
+    return loArr, hiArr
+
+
+def critBounds(n1Arr, n2Arr, kArr, sigAlpha):
+    '''
+    The non-rejection intervals (critInterval) of the margins (n1, n2, k) of 2x2 tables at the significance level
+    sigAlpha. Each margin is packed into a single integer key, and the interval is calculated only for the unique
+    margins that are not in the cache; the margins that cannot be packed into 21 bits are not cached.
+    Return the lower and the upper bounds of the interval of each margin
+    '''
+    n1, n2, k = [np.asarray(arr, dtype=np.uint64).ravel() for arr in [n1Arr, n2Arr, kArr]]
+    loArr, hiArr = np.empty(len(n1), dtype=np.int64), np.empty(len(n1), dtype=np.int64)
+
+    packable = np.maximum(np.maximum(n1, n2), k) < 2**21
+    if not packable.all():
+        loArr[~packable], hiArr[~packable] = critInterval(n1[~packable], n2[~packable], k[~packable], sigAlpha)
+
+    keyArr = (n1[packable]<<np.uint64(42)) | (n2[packable]<<np.uint64(21)) | k[packable]
+    uKeyArr, invArr = np.unique(keyArr, return_inverse=True)
+
+    # The bounds of an interval are stored as a single value, lo*2**21 + hi, which is exact in float64
+    cache = critCacheOf(sigAlpha)
+    uValArr = cacheLookup(cache, uKeyArr)
+    missing = np.isnan(uValArr)
+    if missing.any():
+        mKeyArr, mask = uKeyArr[missing], np.uint64(2**21-1)
+        mLoArr, mHiArr = critInterval(mKeyArr>>np.uint64(42), (mKeyArr>>np.uint64(21)) & mask, mKeyArr & mask, sigAlpha)
+        uValArr[missing] = mLoArr * 2**21 + mHiArr
+        cacheUpdate(cache, mKeyArr, uValArr[missing])
+
+    uValArr = uValArr.astype(np.int64)
+    loArr[packable], hiArr[packable] = (uValArr >> 21)[invArr.ravel()], (uValArr & (2**21-1))[invArr.ravel()]
+
+    return loArr, hiArr
+
+
+def fisherSig(a_Arr, b_Arr, c_Arr, d_Arr, sigAlpha):
+    '''
+    Whether the two-tail p-values of Fisher's exact test of the 2x2 tables [[a, b], [c, d]] are less than sigAlpha.
+    Instead of calculating the p-values, 'a' is compared with the non-rejection interval of the margins of the
+    table (critBounds)
+    '''
+    a, b, c, d = [np.asarray(arr, dtype=np.int64).ravel() for arr in [a_Arr, b_Arr, c_Arr, d_Arr]]
+    loArr, hiArr = critBounds(a+b, c+d, a+c, sigAlpha)
+
+    return (a < loArr) | (a > hiArr)
+
+
+def binomTableOf(altFreq, maxDepth):
+    '''
+    Alias tables (Walker's alias method) of the binomial distributions of the ALT reads at the locus depths
+    0..maxDepth and the ALT allele frequency altFreq, cached in binomTables. The tails of a distribution with a
+    probability less than nullTailProb are left out, as in nullSigProb; the cells of the supports of all the depths
+    are stored consecutively.
+    Return the width and the offset of the support of each depth, and the acceptance probability, the ALT reads,
+    and the alias ALT reads of each cell
+    '''
+    if altFreq in binomTables and len(binomTables[altFreq][0]) > maxDepth:
+        return binomTables[altFreq]
+
+    from scipy.stats import binom
+
+    nArr = np.arange(maxDepth+1)
+    loArr = np.maximum(np.nan_to_num(binom.ppf(nullTailProb, nArr, altFreq)).astype(np.int64)-1, 0)
+    hiArr = np.minimum(np.nan_to_num(binom.isf(nullTailProb, nArr, altFreq), nan=maxDepth).astype(np.int64), nArr)
+    hiArr = np.maximum(hiArr, loArr)
+    widthArr = hiArr - loArr + 1
+    offsetArr = np.cumsum(widthArr) - widthArr
+
+    cellDepth = np.repeat(nArr, widthArr)
+    valArr = np.arange(widthArr.sum()) - np.repeat(offsetArr, widthArr) + np.repeat(loArr, widthArr)
+    pmfArr = binom.pmf(valArr, cellDepth, altFreq)
+    probArr, aliasArr = np.ones(len(valArr)), valArr.copy()
+
+    # The probabilities of a depth are scaled to a mean of 1; each cell below 1 is topped up by a cell above 1, its
+    # alias, which is drawn instead with the probability of the missing part
+    for n in nArr:
+        off, width = offsetArr[n], widthArr[n]
+        scaledL = list(pmfArr[off:off+width] / pmfArr[off:off+width].sum() * width)
+        smallL = [i for i in range(width) if scaledL[i] < 1.0]
+        largeL = [i for i in range(width) if scaledL[i] >= 1.0]
+        while smallL and largeL:
+            s, l = smallL.pop(), largeL.pop()
+            probArr[off+s], aliasArr[off+s] = scaledL[s], valArr[off+l]
+            scaledL[l] += scaledL[s] - 1.0
+            (smallL if scaledL[l] < 1.0 else largeL).append(l)
+
+    binomTables[altFreq] = (widthArr, offsetArr, probArr, valArr, aliasArr)
+
+    return binomTables[altFreq]
+
+
+def binomDraw(uArr, depthArr, altFreq):
+    '''
+    Binomial ALT reads of the locus depths in depthArr at the ALT allele frequency altFreq, from the uniform random
+    numbers in uArr, one for each draw, with the alias tables of binomTableOf. A uniform number selects a cell of the
+    support, and its fraction decides between the cell and its alias. uArr is overwritten
+    '''
+    widthArr, offsetArr, probArr, valArr, aliasArr = binomTables[altFreq]
+
+    vArr = np.multiply(uArr, widthArr[depthArr], out=uArr)
+    cellArr = vArr.astype(np.int64)
+    vArr -= cellArr
+    cellArr += offsetArr[depthArr]
+
+    return np.where(vArr < probArr[cellArr], valArr[cellArr], aliasArr[cellArr])
+
+
+def smRatioBlock(numOfRep, seedSeq):
+    '''
+    Simulate the sSNP/totalSNP ratios of a block of numOfRep sliding windows with the random number stream seedSeq.
+    The SNP data are read from smData, which is inherited by the worker processes. The replications are simulated
+    in chunks, each chunk is a (replications x SNPs) matrix of locus depths and simulated ALT reads tested at once;
+    the chunk size is chosen so that the matrices fit in smMemBudget. The sampled SNPs and the uniform numbers of the
+    ALT reads of each bulk are drawn for a whole chunk at once from streams of their own, spawned from seedSeq, so the
+    simulated ratios of a seed are the same whatever the chunk size. If several sliding windows are simulated
+    together, seedSeq is a tuple of the streams of the windows, and the ALT reads of each bulk in a window are drawn
+    from a stream of their own.
+    The ALT reads are drawn with binomDraw, and a simulated SNP is tested by comparing its ALT reads in the first bulk
+    with the non-rejection interval of its margin; the intervals are kept in the margin table of smData and fetched
+    with critBounds the first time a margin is simulated
+    '''
+    snpPairArr, pairArr, marginArr, sampleSize, segArr, sizeArr = smData
+    marginBase, marginN1, marginN2, marginK, marginLo, marginHi, marginKnown = marginArr
+    numOfSNP = len(snpPairArr) if sampleSize is None else sampleSize
+    chunk = int(max(1, min(numOfRep, smMemBudget // (max(numOfSNP, 1) * smBytesPerSNP))))
+
+    if segArr is not None:
+        ratioArr, segLen = np.empty((numOfRep, len(segArr))), np.diff(np.append(segArr, numOfSNP))
+        segRNGL = [[np.random.default_rng(s) for s in segSeedSeq.spawn(2)] for segSeedSeq in seedSeq]
+        fbUBuf, sbUBuf = np.empty((chunk, numOfSNP)), np.empty((chunk, numOfSNP))
+    else:
+        ratioArr = np.empty(numOfRep) if sizeArr is None else np.empty((numOfRep, len(sizeArr)))
+        idxRNG, fbRNG, sbRNG = [np.random.default_rng(s) for s in seedSeq.spawn(3)]
+
+    for start in range(0, numOfRep, chunk):
+        n = min(chunk, numOfRep-start)
+
+        # The pairs of locus depths of the SNPs; a sliding window-specific threshold uses all the SNPs in each
+        # replication, and the vector is broadcast over the replications
+        if sampleSize is None:
+            pairIdx = snpPairArr
+        else:
+            pairIdx = snpPairArr[idxRNG.integers(0, len(snpPairArr), size=(n, numOfSNP))]
+
+        # The uniform numbers of a sliding window are drawn from its streams row by row, as the matrices are filled in
+        # row-major order
+        if segArr is not None:
+            fbU, sbU = fbUBuf[:n], sbUBuf[:n]
+            for (fbSegRNG, sbSegRNG), lo, size in zip(segRNGL, segArr, segLen):
+                fbU[:, lo:lo+size] = fbSegRNG.random((n, size))
+                sbU[:, lo:lo+size] = sbSegRNG.random((n, size))
+        else:
+            fbU, sbU = fbRNG.random((n, numOfSNP)), sbRNG.random((n, numOfSNP))
+
+        fbALT = binomDraw(fbU, pairArr[0][pairIdx], fb_Freq)
+        sbALT = binomDraw(sbU, pairArr[1][pairIdx], sb_Freq)
+        del fbU, sbU
+
+        # The margins not simulated before are marked, and their intervals are added to the margin table
+        mIdx = marginBase[pairIdx] + fbALT + sbALT
+        newArr = np.zeros(len(marginKnown), dtype=bool)
+        newArr[mIdx] = True
+        newArr = np.flatnonzero(newArr & ~marginKnown)
+        if len(newArr) > 0:
+            marginLo[newArr], marginHi[newArr] = critBounds(marginN1[newArr], marginN2[newArr], marginK[newArr], smAlpha)
+            marginKnown[newArr] = True
+
+        sm_Sig_Arr = (fbALT < marginLo[mIdx]) | (fbALT > marginHi[mIdx])
+        del fbALT, sbALT, mIdx
+
+        if segArr is not None:
+            ratioArr[start:start+n] = np.add.reduceat(sm_Sig_Arr, segArr, axis=1, dtype=np.int64) / segLen
+        elif sizeArr is not None:
+            # The sampled SNPs are independent, so the first k SNPs of a replication are a sample of size k as well
+            ratioArr[start:start+n] = np.cumsum(sm_Sig_Arr, axis=1, dtype=np.int64)[:, sizeArr-1] / sizeArr
+        else:
+            ratioArr[start:start+n] = sm_Sig_Arr.mean(axis=1)
+
+    return ratioArr
+
+
+def smRatioBlockTask(numOfRep, seedSeq):
+    '''
+    smRatioBlock in a worker process. The entries it adds to the caches of Fisher's exact test are returned with the
+    ratios, so they can be merged into the caches of the parent process and the tables are not tested again by the
+    later simulations of the run
+    '''
+    keyDict = {name: cache['keys'] for name, cache in fisherCaches().items()}
+    ratioArr = smRatioBlock(numOfRep, seedSeq)
+
+    return ratioArr, cacheAdded(keyDict)
+
+
+def smRatios(fbLDArr, sbLDArr, numOfRep, sampleSize=None, segArr=None, seedSeq=None, sizeArr=None):
+    '''
+    Simulate the sSNP/totalSNP ratios of numOfRep sliding windows. The replications are split into blocks of
+    smBlockSize, each block has its own random number stream spawned from smSeedSeq; the blocks are distributed to
+    numOfJobs worker processes, and the results are identical whatever the number of workers.
+    sampleSize: the SNPs of a simulated sliding window are sampled with replacement if given (genome-wide
+                threshold), otherwise all the SNPs are used (sliding window-specific threshold)
+    segArr: the start indices of the SNPs of several sliding windows concatenated in fbLDArr and sbLDArr; if given,
+            the windows are simulated together and a (replications x windows) matrix is returned
+    seedSeq: the random number streams of the blocks are spawned from seedSeq instead of smSeedSeq if given; if
+             segArr is given, seedSeq is a list of the streams of the sliding windows, the streams of the blocks are
+             spawned from each of them, so the ratios of a window do not depend on the other windows
+    sizeArr: the sizes of several genome-wide sliding windows, the largest of which is sampleSize; if given, the
+             ratios of all the sizes are calculated from the same samples and a (replications x sizes) matrix is
+             returned
+    '''
+    global smData
+    fbLDArr, sbLDArr = np.asarray(fbLDArr, dtype=np.int64), np.asarray(sbLDArr, dtype=np.int64)
+
+    # The SNPs are simulated by their pairs of locus depths. The margins of the simulated tables of a pair have the
+    # locus depths of the pair and a total of ALT reads k within the sum of the supports of the alias tables; the
+    # margins of all the pairs form the margin table, whose non-rejection intervals are filled in by smRatioBlock
+    pairArr, snpPairArr = np.unique(np.column_stack((fbLDArr, sbLDArr)), axis=0, return_inverse=True)
+    pairArr, snpPairArr = (pairArr[:, 0].copy(), pairArr[:, 1].copy()), snpPairArr.ravel()
+    maxDepth = int(max(fbLDArr.max(initial=0), sbLDArr.max(initial=0)))
+    fbTable, sbTable = binomTableOf(fb_Freq, maxDepth), binomTableOf(sb_Freq, maxDepth)
+
+    kLoArr = fbTable[3][fbTable[1][pairArr[0]]] + sbTable[3][sbTable[1][pairArr[1]]]
+    kWidthArr = fbTable[0][pairArr[0]] + sbTable[0][pairArr[1]] - 1
+    marginPair = np.repeat(np.arange(len(kLoArr)), kWidthArr)
+    marginBase = np.cumsum(kWidthArr) - kWidthArr - kLoArr
+    marginK = np.arange(len(marginPair)) - marginBase[marginPair]
+    marginArr = (marginBase, pairArr[0][marginPair], pairArr[1][marginPair], marginK, np.empty(len(marginPair), dtype=np.int64),
+                 np.empty(len(marginPair), dtype=np.int64), np.zeros(len(marginPair), dtype=bool))
+    smData = (snpPairArr, pairArr, marginArr, sampleSize, segArr, sizeArr)
+
+    blockL = [min(smBlockSize, numOfRep-start) for start in range(0, numOfRep, smBlockSize)]
+    if segArr is None:
+        seedL = (smSeedSeq if seedSeq is None else seedSeq).spawn(len(blockL))
+    else:
+        seedL = list(zip(*[segSeedSeq.spawn(len(blockL)) for segSeedSeq in seedSeq]))
+
+    # The worker processes are forked so that they inherit smData and the settings of the run; the queued writes are
+    # completed first, so no writer thread is in the middle of a write when the process is forked
+    if numOfJobs > 1 and len(blockL) > 1:
+        outputWait()
+        with mp.get_context('fork').Pool(min(numOfJobs, len(blockL))) as pool:
+            resultL = pool.starmap(smRatioBlockTask, zip(blockL, seedL))
+        for __, addedDict in resultL:
+            cacheMerge(addedDict)
+        ratioL = [ratioArr for ratioArr, __ in resultL]
+    else:
+        ratioL = [smRatioBlock(n, seedSeq) for n, seedSeq in zip(blockL, seedL)]
+
+    return np.concatenate(ratioL) if ratioL else np.empty(0)
+
+
+def pctlInterval(ratioArr, q, conf):
+    '''
+    Distribution-free confidence interval of the q-th quantile of the simulated ratios. The number of ratios below
+    the quantile follows Binomial(n, q), so the order statistics at its (1-conf)/2 and (1+conf)/2 quantiles bound the
+    quantile with a probability of at least conf. The quantiles of the columns are bounded if ratioArr is a matrix
+    '''
+    from scipy.stats import binom
+
+    ratioArr = np.sort(ratioArr, axis=0)
+    n = len(ratioArr)
+    lo = int(np.clip(binom.ppf((1-conf)/2, n, q) - 1, 0, n-1))
+    hi = int(np.clip(binom.ppf((1+conf)/2, n, q), 0, n-1))
+
+    return ratioArr[lo], ratioArr[hi]
+
+
+def smRatiosAdaptive(fbLDArr, sbLDArr, sampleSize=None, segArr=None, seedSeq=None, sizeArr=None):
+    '''
+    Simulate the sSNP/totalSNP ratios in batches of smAdaptBatch replications until the confidence interval of the
+    99.5th percentile is narrower than smTolerance, or until rep replications are simulated. If several sliding
+    windows are simulated together, the simulation stops when the intervals of all of them are narrow enough.
+    Return the simulated ratios and the width of the confidence interval
+    '''
+    ratioArr = smRatios(fbLDArr, sbLDArr, min(smAdaptBatch, rep), sampleSize, segArr, seedSeq, sizeArr)
+    lo, hi = pctlInterval(ratioArr, 0.995, smAdaptConf)
 
-    return np.percentile(ratioLi, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])
+    while np.max(hi - lo) > smTolerance and len(ratioArr) < rep:
+        ratioArr = np.concatenate((ratioArr, smRatios(fbLDArr, sbLDArr, min(smAdaptBatch, rep-len(ratioArr)), sampleSize, segArr, seedSeq, sizeArr)))
+        lo, hi = pctlInterval(ratioArr, 0.995, smAdaptConf)
+
+    return ratioArr, hi - lo
+
+
+def smRatiosRep(fbLDArr, sbLDArr, sampleSize=None):
+    '''
+    Simulate rep replications, or fewer if the adaptive mode is on; the number of replications and the width of the
+    confidence interval of the 99.5th percentile are recorded in misc
+    '''
+    if adaptiveRep == False:
+        return smRatios(fbLDArr, sbLDArr, rep, sampleSize)
+
+    ratioArr, ciWidth = smRatiosAdaptive(fbLDArr, sbLDArr, sampleSize)
+    misc.append(['Number of replications for threshold calculation', len(ratioArr)])
+    misc.append([f'Width of the {smAdaptConf:.0%} confidence interval of the 99.5th percentile', ciWidth])
+
+    return ratioArr
 
 
 # For the calculation of the genome-wide threshold
 def smThresholds_gw(DF):
     print('Calculate the threshold of sSNPs/totalSNPs.')
-    gw_ratioLi = []
-    for __ in range(rep):
-        sm_SNP_SMPL = DF.sample(snpPerSW, replace=True)
+    gw_ratioArr = smRatiosRep(DF[fb_LD].to_numpy(), DF[sb_LD].to_numpy(), snpPerSW)
 
-        gw_sm_fb_AD_ALT_Arr = np.random.binomial(sm_SNP_SMPL[fb_LD], fb_Freq).astype(np.uint)
-        gw_sm_fb_AD_REF_Arr = sm_SNP_SMPL[fb_LD].to_numpy().astype(np.uint) - gw_sm_fb_AD_ALT_Arr
-        gw_sm_sb_AD_ALT_Arr = np.random.binomial(sm_SNP_SMPL[sb_LD], sb_Freq).astype(np.uint)
-        gw_sm_sb_AD_REF_Arr = sm_SNP_SMPL[sb_LD].to_numpy().astype(np.uint) - gw_sm_sb_AD_ALT_Arr
-
-        __, __, gw_sm_FE_P_Arr = pvalue_npy(gw_sm_fb_AD_ALT_Arr, gw_sm_fb_AD_REF_Arr, gw_sm_sb_AD_ALT_Arr, gw_sm_sb_AD_REF_Arr)
-        # gw_sm_FE_OR_Arr = (gw_sm_fb_AD_ALT_Arr * gw_sm_sb_AD_REF_Arr) / (gw_sm_fb_AD_REF_Arr * gw_sm_sb_AD_ALT_Arr)
+    misc.append(['Genome-wide sSNP/totalSNP ratio threshold', np.percentile(gw_ratioArr, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])])
+    print(f'Threshold calculation completed, time elapsed: {(time.time()-t0)/60} minutes')
 
-        sSNP_Arr = np.where(gw_sm_FE_P_Arr<smAlpha, 1, 0)
+    return np.percentile(gw_ratioArr, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])
 
-        gw_ratioLi.append(np.mean(sSNP_Arr))
 
-    misc.append(['Genome-wide sSNP/totalSNP ratio threshold', np.percentile(gw_ratioLi, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])])
-    print(f'Threshold calculation completed, time elapsed: {(time.time()-t0)/60} minutes')
+# For the calculation of the sliding window-specific thresholds of several sliding windows at once, each column of the
+# returned array contains the percentiles of a sliding window
+def smThresholds_sw(fbLDArr, sbLDArr, segArr, seedSeq=None):
+    if adaptiveRep == False:
+        sw_ratioArr = smRatios(fbLDArr, sbLDArr, rep, segArr=segArr, seedSeq=seedSeq)
+    else:
+        sw_ratioArr = smRatiosAdaptive(fbLDArr, sbLDArr, segArr=segArr, seedSeq=seedSeq)[0]
 
-    return np.percentile(gw_ratioLi, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])
+    return np.percentile(sw_ratioArr, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0], axis=0)
 
 
-# For the calculation of the sliding window-specific threshold
-def smThresholds_sw(DF):
-    sw_ratioLi = []
+def nullSigProb(fbLDArr, sbLDArr, fbFreq, sbFreq, sigAlpha):
+    '''
+    Under the null hypothesis, the probability of a SNP being identified as a sSNP (p < sigAlpha) depends only on its
+    locus depths in both bulks. For each unique pair of locus depths, the probability is the sum of the binomial
+    probabilities of the simulated REF/ALT reads over the significant tables; the tails of the binomial
+    distributions with a probability less than nullTailProb are ignored.
+    Return the probability of each SNP
+    '''
+    from scipy.stats import binom
 
-    sw_fb_LD_Arr = DF[fb_LD].to_numpy().astype(np.uint)
-    sw_sb_LD_Arr = DF[sb_LD].to_numpy().astype(np.uint)
+    pairArr, invArr = np.unique(np.column_stack((fbLDArr, sbLDArr)).astype(np.int64), axis=0, return_inverse=True)
+    fbN, sbN = pairArr[:, 0], pairArr[:, 1]
 
-    for __ in range(rep):
-        # Create new columns for Fisher's exact test simulated P-values
-        sw_sm_fb_AD_ALT_Arr = np.random.binomial(DF[fb_LD], fb_Freq).astype(np.uint)
-        sw_sm_fb_AD_REF_Arr = sw_fb_LD_Arr - sw_sm_fb_AD_ALT_Arr
-        sw_sm_sb_AD_ALT_Arr = np.random.binomial(DF[sb_LD], sb_Freq).astype(np.uint)
-        sw_sm_sb_AD_REF_Arr = sw_sb_LD_Arr - sw_sm_sb_AD_ALT_Arr
+    fbLo, fbHi = binom.ppf(nullTailProb, fbN, fbFreq).astype(np.int64), binom.isf(nullTailProb, fbN, fbFreq).astype(np.int64)
+    sbLo, sbHi = binom.ppf(nullTailProb, sbN, sbFreq).astype(np.int64), binom.isf(nullTailProb, sbN, sbFreq).astype(np.int64)
+    fbLo, sbLo = np.maximum(fbLo-1, 0), np.maximum(sbLo-1, 0)
+    fbW, sbW = np.minimum(fbHi, fbN) - fbLo + 1, np.minimum(sbHi, sbN) - sbLo + 1
+    gridSize = fbW * sbW
 
-        __, __, sw_sm_FE_P_Arr = pvalue_npy(sw_sm_fb_AD_ALT_Arr, sw_sm_fb_AD_REF_Arr, sw_sm_sb_AD_ALT_Arr, sw_sm_sb_AD_REF_Arr)
-        # sw_sm_FE_OR_Arr = (sw_sm_fb_AD_ALT_Arr * sw_sm_sb_AD_REF_Arr) / (sw_sm_fb_AD_REF_Arr * sw_sm_sb_AD_ALT_Arr)
+    # Each pair of locus depths has a (fbW x sbW) grid of simulated ALT reads; the grids of consecutive pairs are
+    # flattened and processed together, with the number of tables processed at a time bounded by feBlockSize
+    probArr = np.zeros(len(pairArr))
+    cumGrid = np.cumsum(gridSize)
+    start = 0
+    while start < len(pairArr):
+        base = cumGrid[start] - gridSize[start]
+        end = max(np.searchsorted(cumGrid, base+feBlockSize*16, 'right'), start+1)
+        pIdx = np.repeat(np.arange(start, end), gridSize[start:end])
+        cellIdx = np.arange(base, cumGrid[end-1]) - np.repeat(cumGrid[start:end]-gridSize[start:end], gridSize[start:end])
 
-        sSNP_Arr = np.where(sw_sm_FE_P_Arr<smAlpha, 1, 0)
+        fbX, sbX = fbLo[pIdx] + cellIdx // sbW[pIdx], sbLo[pIdx] + cellIdx % sbW[pIdx]
+        wArr = binom.pmf(fbX, fbN[pIdx], fbFreq) * binom.pmf(sbX, sbN[pIdx], sbFreq)
+        sigArr = fisherSig(fbX, fbN[pIdx]-fbX, sbX, sbN[pIdx]-sbX, sigAlpha)
 
-        sw_ratioLi.append(np.mean(sSNP_Arr))
+        probArr[start:end] = np.bincount(pIdx-start, weights=wArr*sigArr, minlength=end-start)
+        start = end
 
-    return np.percentile(sw_ratioLi, [0.5, 99.5, 2.5, 97.5, 5.0, 95.0])
+    return probArr[invArr.ravel()]
 
 
-def zeroSNP(li):
-    # Replace 'divide by zero' with the nearnest value. Use 'empty' as a placeholder if it is the first element of the list
-    if li != []:
-        li.append(li[-1])   # Assign the previous value to the empty sliding window if the list is not empty
-    else:
-        li.append('empty')  # Assign 'empty' to the first sliding windows that is empty
+# For the calculation of the genome-wide threshold without simulation
+def smThresholds_exact(DF):
+    '''
+    The SNPs of a simulated sliding window are sampled with replacement, so each of them is a sSNP with the mean
+    probability of all the SNPs, and the number of sSNPs in the sliding window follows a binomial distribution
+    '''
+    from scipy.stats import binom
 
+    print('Calculate the threshold of sSNPs/totalSNPs analytically.')
+    sigProb = nullSigProb(DF[fb_LD].to_numpy(), DF[sb_LD].to_numpy(), fb_Freq, sb_Freq, smAlpha).mean()
+    gw_ratioArr = binom.ppf(np.array([0.5, 99.5, 2.5, 97.5, 5.0, 95.0])/100, snpPerSW, sigProb) / snpPerSW
 
-def replaceZero(li):
-    # Replace the 'empty' placeholders at the begining of the list with the nearnest non-empty value
-    i = 0
-    while li[i]=='empty':
-        i += 1
+    misc.append(['Genome-wide sSNP/totalSNP ratio threshold', gw_ratioArr])
+    misc.append(['Probability of a SNP being a sSNP under the null hypothesis', sigProb])
+    print(f'Threshold calculation completed, time elapsed: {(time.time()-t0)/60} minutes')
 
-    j = 0
-    while j < i:
-        li[j] = li[i]
-        j += 1
+    return gw_ratioArr
 
 
-def bsaseqPlot(chrmIDL, datafr, datafrT):
+def swIndex(posArrT, posArr, fbLDArr, sbLDArr, sigProbArr=None):
     '''
-    wmL: list of warning messages
-    swDict: a dictionary with the chromosome ID as its keys; the value of each key is a list containing
-            the chromosome ID, the sSNP/totalSNP ratio in each sliding window, and the midpoint of
-            the sliding window
+    Sorted SNP positions and prefix sums of a chromosome, from which the sliding window statistics of any window size
+    and incremental step are calculated (swSeries).
+    posArrT: positions of all the SNPs; posArr: positions of the sSNPs
+    fbLDArr, sbLDArr: locus depths of all the SNPs in the first and the second bulk
+    sigProbArr: the probabilities of all the SNPs being sSNPs under the null hypothesis; if given, the prefix sums of
+                the first three cumulants of the number of sSNPs are included for the thresholds of the sliding windows
     '''
-    print('Prepare SNP data for plotting via the sliding window algorithm')
-    global misc
-    global snpRegion, swDataFrame
-    sg_yRatio_List = []
-    swRows = []
-    wmL, swDict, snpRegion = [], {}, []
+    order = np.argsort(posArrT, kind='stable')
+    swIdx = {'posArrT': posArrT[order], 'posArr': np.sort(posArr), 'cumLD': [], 'cumul': None}
 
-    # Analyze each chromsome separately
-    numOfSNPOnChr, ratioPeakL = [], []
-    i = 1
-    for chrmID in chrmIDL:
-        ch = datafr[datafr.CHROM==chrmID]
-        chT = datafrT[datafrT.CHROM==chrmID]
-        numOfSNPOnChr.append([chrmID, len(ch.index), len(chT.index), len(ch.index)/len(chT.index)])
+    for ldArr in [fbLDArr, sbLDArr]:
+        swIdx['cumLD'].append(np.concatenate(([0], np.cumsum(ldArr[order], dtype=np.int64))))
 
-        regStart = 1
-        regEnd = chT['POS'].max()
-        # if regStart == 0:
-        #     regStart = 1
-        # else:
-        #     regStart = regStart // 10000 * 10000 + 1
-
-        # if regEnd == 0:
-        #     regEnd = chT['POS'].max()
-        # else:
-        #     regEnd = (regEnd // 10000 + 1) * 10000
-
-        # Sliding window. swStr: the begining of the window; swEnd: the end of the window; icrs: incremental step
-        swStr, swEnd, icrs = regStart, swSize, incrementalStep
-        plotSP = regStart
-        # x and y are lists, each sliding window represents a single data point
-        x, y, yT, yRatio = [], [], [], []
-        while swEnd <= regEnd:
-            # A single sliding window - a dataframe
-            # swDF: sSNPs in a sliding window; swDFT: all SNPs in a sliding window
-            swDF = ch[(ch.POS>=swStr) & (ch.POS<=swEnd)]
-            swDFT = chT[(chT.POS>=swStr) & (chT.POS<=swEnd)]
-
-            rowInSwDF = len(swDF.index)                 # number of sSNPs in a sliding window
-            rowInSwDFT = len(swDFT.index)               # number of total SNPs in a sliding window
-
-            x.append(swStr)                   # Append the starpoint of a sliding window to x
-            y.append(rowInSwDF)                         # Append number of sSNPs in a sliding window to y
-            yT.append(rowInSwDFT)                       # Append number of totalSNPs in a sliding window to yT
-
-            # len(swDL) or len(swDLT) would be zero if no SNP in a sliding window
-            try:
-                yRatio.append(float(rowInSwDF/rowInSwDFT))  # Append the ratio of sSNP/totalSNP in a sliding window to yRatio
-            except ZeroDivisionError as e:
-                wmL.append(['No SNP', i, swStr, e])
-                zeroSNP(yRatio)
+    # Under the null hypothesis, the number of sSNPs of a sliding window is the sum of independent Bernoulli variables;
+    # its first three cumulants are sums over the SNPs of the window, obtained from prefix sums
+    if sigProbArr is not None:
+        p = sigProbArr[order]
+        swIdx['cumul'] = [np.concatenate(([0], np.cumsum(termArr))) for termArr in [p, p*(1-p), p*(1-p)*(1-2*p)]]
 
-            rowContents = [chrmID, swStr, int(swDFT[fb_LD].mean()), int(swDFT[sb_LD].mean()), rowInSwDF, rowInSwDFT, yRatio[-1]]
+    return swIdx
 
-            swRows.append(rowContents)
 
-            if i not in swDict:
-                swDict[i] = [rowContents]
-            else:
-                swDict[i].append(rowContents)
+def swSeries(swIdx, regEnd, swSize, swStep):
+    '''
+    Sliding window statistics of a chromosome from its index (swIndex).
+    Return the start point, number of sSNPs, number of totalSNPs, average locus depth of each bulk, and the
+    sSNP/totalSNP ratio of each sliding window, followed by the thresholds if the index contains the cumulants. The
+    ratio and the threshold are NaN and the average locus depth is 0 if a sliding window contains no SNP
+    '''
+    # A sliding window covers [swStr, swStr+swSize-1], the last one should not go beyond the end of the chromosome.
+    # regEnd, the position of the last SNP, may be unsigned if it is loaded from the stage cache, so it is converted
+    # before the subtraction; if the SNPs end before swSize after filtering, the chromosome has a single sliding
+    # window starting at 1, which is within the chromosome as only chromosomes larger than swSize are analyzed
+    swStrArr = np.arange(1, max(int(regEnd)-swSize+2, 2), swStep)
+    swEndArr = swStrArr + swSize - 1
+
+    # The SNPs of a sliding window are the rows [lo, hi) of the sorted arrays
+    lo, hi = regionBounds(swIdx['posArrT'], swStrArr, swEndArr)
+    totalSNP = hi - lo
+    sSNP = np.searchsorted(swIdx['posArr'], swEndArr, 'right') - np.searchsorted(swIdx['posArr'], swStrArr, 'left')
+
+    avgLD = []
+    for cumLD in swIdx['cumLD']:
+        avgLD.append(np.where(totalSNP>0, (cumLD[hi]-cumLD[lo]) // np.maximum(totalSNP, 1), 0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = sSNP / totalSNP
 
-            swStr += icrs
-            swEnd += icrs
+    if swIdx['cumul'] is None:
+        return [swStrArr, sSNP, totalSNP, avgLD[0], avgLD[1], ratio]
 
-        # Replace the 'empty' values at the begining of the lists with nearest non-empty value
-        if 'empty' in yRatio:
-            replaceZero(yRatio)
+    cumul = [cumTerm[hi] - cumTerm[lo] for cumTerm in swIdx['cumul']]
 
-        pIndex = 0
-        while swDict[i][pIndex][1] == 'empty':
-            pIndex += 1
+    return [swStrArr, sSNP, totalSNP, avgLD[0], avgLD[1], ratio, swThresholds(cumul[0], cumul[1], cumul[2], totalSNP)]
 
-        j = 0
-        while j < pIndex:
-            swDict[i][j][1] = swDict[i][pIndex][1]
-            j += 1
 
-        # Data smoothing
-        sg_yRatio = savgol_filter(yRatio, smthWL, polyOrder)
+def slidingWindows(posArrT, posArr, fbLDArr, sbLDArr, regEnd, swSize, swStep, sigProbArr=None):
+    '''
+    Sliding window statistics of a chromosome, calculated with sorted SNP positions and prefix sums
+    instead of masking the dataframe for each sliding window (swIndex and swSeries)
+    '''
+    return swSeries(swIndex(posArrT, posArr, fbLDArr, sbLDArr, sigProbArr), regEnd, swSize, swStep)
 
-        sg_yRatio_List.extend(sg_yRatio)
 
-        # Handle the plot with a single column (chromosome)
-        if len(chrmIDL) == 1:
-            # Set up x-ticks
-            axs[0].set_xticks(np.arange(0, max(x), 10000000))
-            ticks = axs[0].get_xticks()*1e-7
-            axs[0].set_xticklabels(ticks.astype(int))
+def swThresholds(meanArr, varArr, k3Arr, totalSNP, q=0.995):
+    '''
+    The q-th quantile of the sSNP/totalSNP ratio of each sliding window under the null hypothesis. The quantile of the
+    number of sSNPs is approximated with the Cornish-Fisher expansion of its cumulants and a continuity correction
+    '''
+    from scipy.stats import norm
 
-            # Add ylabels to the first column of the subplots
-            if i==1:
-                axs[0].set_ylabel('Number of SNPs')
-                axs[1].set_ylabel(r'sSNP/totalSNP')
+    z = norm.ppf(q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sdArr = np.sqrt(varArr)
+        skewArr = np.where(sdArr>0, k3Arr / sdArr**3, 0.0)
+        sSNPArr = np.ceil(meanArr + sdArr*(z + (z**2-1)*skewArr/6) - 0.5)
 
-            # SNP plot
-            axs[0].plot(x, y, c='k')
-            axs[0].plot(x, yT, c='b')
-            axs[0].set_title('Chr'+chrmID)
+        return np.clip(sSNPArr, 0, totalSNP) / totalSNP
 
-            # sSNP/totalSNP plot
-            if smoothing == True:
-                axs[1].plot(x, sg_yRatio, c='k')
-            else:
-                axs[1].plot(x, yRatio, c='k')
 
-            # axs[1].plot(x, smThresholds_sw, c='m')
+def chrmSWStatistics(i, chrmID):
+    '''
+    Sliding window statistics of the i-th chromosome chrmID, smoothed, and the genomic regions of the chromosome related
+    to the trait with their peaks. The chromosomes are independent of each other given the threshold, so they can be
+    analyzed by worker processes, which inherit the SNPs (snpDF, or the memory-mapped partitions) from the parent.
+    Return the rows of the sliding windows, the row of numOfSNPOnChrFile.csv, the warning messages, the regions, the
+    highest ratio, the smoothed ratios, and the thresholds of the sliding windows
+    '''
+    from scipy.signal import savgol_filter
+
+    # The sliding window statistics of the chromosome are retrieved from the stage cache if they have been
+    # calculated with the same SNPs and parameters, otherwise they are calculated and saved in a new entry
+    swResults = stageLoad(swKeys[chrmID])
+    if swResults is not None:
+        with np.load(os.path.join(stageDir(swKeys[chrmID]), 'swStats.npz')) as swNpz:
+            swStats = [swNpz[f'arr_{j}'] for j in range(len(swNpz.files))]
+        numOfSNPOnChr = swResults['numOfSNPOnChr']
+    else:
+        chT = chrmSNPs(chrmID)
+        ch = chT[chT['FE_P']<alpha]
 
-            # Add the 99.5 percentile line as threshold, x[-1] is the midpoint of the last sliding window of a chromosome
-            axs[1].plot([plotSP, x[-1]], [thrshld, thrshld], c='r')
+        regEnd = chT['POS'].max()
 
-        # Handle the plot with multiple columns (chromosomes)
+        # Sliding window statistics of the entire chromosome. x and y are lists, each sliding window represents a single data point
+        # The probability of each SNP being a sSNP under the null hypothesis, for the thresholds of the sliding windows
+        if swThrshldMode == True:
+            sigProbArr = nullSigProb(chT[fb_LD].to_numpy(), chT[sb_LD].to_numpy(), fb_Freq, sb_Freq, smAlpha)
+            swStats = slidingWindows(chT['POS'].to_numpy(), ch['POS'].to_numpy(), chT[fb_LD].to_numpy(), chT[sb_LD].to_numpy(), regEnd, swSize, incrementalStep, sigProbArr)
         else:
-            # Set up x-ticks
-            axs[0,i-1].set_xticks(np.arange(0, max(x), 10000000))
-            ticks = axs[0,i-1].get_xticks()*1e-7
-            axs[0,i-1].set_xticklabels(ticks.astype(int))
-
-            # Add ylabels to the first column of the subplots
-            if i==1:
-                axs[0,i-1].set_ylabel('Number of SNPs')
-                axs[1,i-1].set_ylabel(r'sSNP/totalSNP')
-
-            # SNP plot
-            axs[0,i-1].plot(x, y, c='k')
-            axs[0,i-1].plot(x, yT, c='b')
-            axs[0,i-1].set_title('Chr'+chrmID)
-
-            # sSNP/totalSNP plot
-            if smoothing == True:
-                axs[1,i-1].plot(x, sg_yRatio, c='k')
-            else:
-                axs[1,i-1].plot(x, yRatio, c='k')
-
-            # axs[1, i-1].plot(x, smThresholds_sw, c='m')
-
-            # Add the 99.5 percentile line as threshold, x[-1] is the midpoint of the last sliding window of a chromosome
-            axs[1,i-1].plot([plotSP, x[-1]], [thrshld, thrshld], c='r')
-
-        ratioPeakL.append(max(yRatio))
-
-        # Identify genomic regions related to the trait
-        m, peaks = 0, []
-        # Handle the case in which an QTL is at the very begining of the chromosome
-        if swDict[i][0][6] >= thrshld:
-            snpRegion.append(swDict[i][0][:2])
-            if swDict[i][0][6] >= swDict[i][1][6]:
-                peaks.append(swDict[i][0][1:])
-            numOfSWs = 1
+            swStats = slidingWindows(chT['POS'].to_numpy(), ch['POS'].to_numpy(), chT[fb_LD].to_numpy(), chT[sb_LD].to_numpy(), regEnd, swSize, incrementalStep)
+        numOfSNPOnChr = [chrmID, len(ch.index), len(chT.index), len(ch.index)/len(chT.index)]
 
-        while m < len(swDict[i]) - 1:
-            if swDict[i][m][6] < thrshld and swDict[i][m+1][6] >= thrshld:
-                snpRegion.append(swDict[i][m+1][:2])
-                numOfSWs = 1
-            elif swDict[i][m][6] >= thrshld:
-                # A sliding window is considered as a peak if its sSNP/totalSNP is greater than or equal to the threshold and greater than those of the flanking sliding windows
-                if m >= 1 and max(swDict[i][m-1][6], swDict[i][m+1][6]) <= swDict[i][m][6]:
-                    peaks.append(swDict[i][m][1:])
-                if swDict[i][m+1][6] > thrshld:
-                    numOfSWs += 1
-                elif swDict[i][m+1][6] < thrshld:
-                    snpRegion[-1].extend([swDict[i][m][1], peaks, numOfSWs])
-                    peaks = []
-            m += 1
-        # Handle the case in which an QTL is nearby the end of the chromosome
-        if swDict[i][-1][6] >= thrshld:
-            snpRegion[-1].extend([swDict[i][-1][1], peaks, numOfSWs])
+        swDir = stageBuildDir(swKeys[chrmID])
+        np.savez(os.path.join(swDir, 'swStats.npz'), *swStats)
+        stageSave(swKeys[chrmID], swParamDict[chrmID], {'numOfSNPOnChr': numOfSNPOnChr}, swDir)
 
-        i += 1
+    x = swStats[0].tolist()
+
+    # The ratio of an empty sliding window is replaced with the nearest non-empty value
+    wmL = []
+    for swStr in swStats[0][np.isnan(swStats[5])]:
+        wmL.append(['No SNP', i, swStr, 'division by zero'])
+
+    yRatio = pd.Series(swStats[5]).ffill().bfill().tolist()
+
+    # The threshold of each sliding window, or the genome-wide threshold for all of them
+    if swThrshldMode == True:
+        thrL = pd.Series(swStats[6]).ffill().bfill().tolist()
+    else:
+        thrL = [thrshld] * len(x)
+
+    swRows = [list(rowContents) for rowContents in zip([chrmID]*len(x), x, swStats[3].tolist(), swStats[4].tolist(), swStats[1].tolist(), swStats[2].tolist(), yRatio)]
+
+    # Data smoothing; the ratios of a chromosome with fewer sliding windows than the smoothing window are not smoothed
+    if len(yRatio) >= smthWL:
+        sg_yRatio = savgol_filter(yRatio, smthWL, polyOrder)
+    else:
+        sg_yRatio = np.array(yRatio)
+
+    # Identify genomic regions related to the trait
+    m, peaks, regionL = 0, [], []
+    # Handle the case in which an QTL is at the very begining of the chromosome
+    if swRows[0][6] >= thrL[0]:
+        regionL.append(swRows[0][:2])
+        if len(swRows) == 1 or swRows[0][6] >= swRows[1][6]:
+            peaks.append(swRows[0][1:])
+        numOfSWs = 1
+
+    while m < len(swRows) - 1:
+        if swRows[m][6] < thrL[m] and swRows[m+1][6] >= thrL[m+1]:
+            regionL.append(swRows[m+1][:2])
+            numOfSWs = 1
+        elif swRows[m][6] >= thrL[m]:
+            # A sliding window is considered as a peak if its sSNP/totalSNP is greater than or equal to the threshold and greater than those of the flanking sliding windows
+            if m >= 1 and max(swRows[m-1][6], swRows[m+1][6]) <= swRows[m][6]:
+                peaks.append(swRows[m][1:])
+            if swRows[m+1][6] > thrL[m+1]:
+                numOfSWs += 1
+            elif swRows[m+1][6] < thrL[m+1]:
+                regionL[-1].extend([swRows[m][1], peaks, numOfSWs])
+                peaks = []
+        m += 1
+    # Handle the case in which an QTL is nearby the end of the chromosome
+    if swRows[-1][6] >= thrL[-1]:
+        regionL[-1].extend([swRows[-1][1], peaks, numOfSWs])
+
+    return [swRows, numOfSNPOnChr, wmL, regionL, max(yRatio), sg_yRatio, thrL if swThrshldMode == True else None]
+
+
+def swStatistics(chrmIDL):
+    '''
+    Sliding window statistics of the chromosomes in chrmIDL and the genomic regions related to the trait. The
+    chromosomes are analyzed by chrmSWStatistics, in numOfJobs worker processes if more than one, and the results are
+    merged in the order of chrmIDL: the sliding windows are saved in swDataFrame and the regions in snpRegion
+    '''
+    print('Prepare SNP data for plotting via the sliding window algorithm')
+    global misc
+    global snpRegion, swDataFrame
+    global swParamDict, swKeys
+
+    # The sliding window statistics and the peaks of each chromosome are saved in the stage cache as well, and are
+    # recalculated only if the SNPs of the chromosome are changed
+    swParamDict, swKeys = {}, {}
+    for chrmID in chrmIDL:
+        swParamDict[chrmID] = {'fisher': fisherKeys[chrmID], 'alpha': alpha, 'swsize': swSize, 'step': incrementalStep, 'swthreshold': swThrshldMode}
+        if swThrshldMode == True:
+            swParamDict[chrmID]['smalpha'] = smAlpha
+        swKeys[chrmID] = stageKey('windows', swParamDict[chrmID])
+
+    # The entries of all the chromosomes are marked as used before the worker processes are forked, so no worker evicts
+    # the entry of another chromosome. The queued writes are completed first, so no writer thread is in the middle of a
+    # write when the processes are forked
+    usedStages.update(swKeys.values())
+    if numOfJobs > 1 and len(chrmIDL) > 1:
+        outputWait()
+        with mp.get_context('fork').Pool(min(numOfJobs, len(chrmIDL))) as pool:
+            chrmResultL = pool.starmap(chrmSWStatistics, enumerate(chrmIDL, 1))
+    else:
+        chrmResultL = [chrmSWStatistics(i, chrmID) for i, chrmID in enumerate(chrmIDL, 1)]
+
+    swRows, numOfSNPOnChr, wmL, snpRegion, ratioPeakL = [], [], [], [], []
+    sg_yRatio_List, swThrshld_List = [], []
+    for chrmID, chrmResults in zip(chrmIDL, chrmResultL):
+        swRows.extend(chrmResults[0])
+        numOfSNPOnChr.append(chrmResults[1])
+        wmL.extend(chrmResults[2])
+        snpRegion.extend(chrmResults[3])
+        ratioPeakL.append(chrmResults[4])
+        sg_yRatio_List.extend(chrmResults[5])
+        if swThrshldMode == True:
+            swThrshld_List.extend(chrmResults[6])
+
+        # The sliding windows of the chromosome are the rows [SWStart, SWEnd) of swDataFrame
+        chrmIdx.loc[chrmID, ['SWStart', 'SWEnd']] = [len(swRows)-len(chrmResults[0]), len(swRows)]
 
     headerResults = ['CHROM','QTLStart','QTLEnd','Peaks', 'NumOfSWs']
-    pd.DataFrame(snpRegion, columns=headerResults).to_csv(os.path.join(results, 'snpRegion.csv'), index=False)
+    queueOutput(resultFile('snpRegion.csv'), writeTable, pd.DataFrame(snpRegion, columns=headerResults), resultFile('snpRegion.csv'))
 
     swDataFrame = pd.DataFrame(swRows, columns=['CHROM', 'sw_Str', fbID+'.AvgLD', sbID+'.AvgLD', 'sSNP', 'toatalSNP', r'sSNP/totalSNP'])
     swDataFrame['smthedRatio'] = sg_yRatio_List
+    if swThrshldMode == True:
+        swDataFrame['Threshold'] = swThrshld_List
 
-    swDataFrame.to_csv(os.path.join(results, 'slidingWindows.csv'), index=False)
+    queueOutput(resultFile('slidingWindows.csv'), writeTable, swDataFrame, resultFile('slidingWindows.csv'))
 
     misc.append(['List of the peaks of the chromosomes', ratioPeakL])
 
@@ -449,6 +1549,87 @@ def bsaseqPlot(chrmIDL, datafr, datafrT):
         xie2.writerow(['Chromosome', 'Num of sSNPs', 'Num of totalSNPs', r'sSNP/totalSNP'])
         xie2.writerows(numOfSNPOnChr)
 
+    print(f'Sliding window analysis completed, time elapsed: {(time.time()-t0)/60} minutes')
+
+
+def bsaseqPlot(chrmIDL):
+    '''
+    Plot the sliding windows of the chromosomes in chrmIDL from swDataFrame, and save the plot in the results folder.
+    matplotlib is imported here, so it is loaded only if the plot is requested
+    '''
+    import matplotlib.pyplot as plt
+
+    # Font settings for plotting
+    plt.rc('font', family='Arial', size=22)     # controls default text sizes
+    plt.rc('axes', titlesize=22)                # fontsize of the axes title
+    plt.rc('axes', labelsize=22)                # fontsize of the x and y labels
+    plt.rc('xtick', labelsize=20)               # fontsize of the tick labels
+    plt.rc('ytick', labelsize=20)               # fontsize of the tick labels
+    plt.rc('legend', fontsize=20)               # legend fontsize
+    plt.rc('figure', titlesize=22)              # fontsize of the figure title
+    # plt.tick_params(labelsize=20)
+
+    # Plot layout setup
+    heightRatio = [1,0.8]
+    fig, axs = plt.subplots(nrows=len(heightRatio), ncols=len(chrmIDL), figsize=(20, 10), sharex='col', sharey='row', 
+            gridspec_kw={'width_ratios': chrmSzL, 'height_ratios': heightRatio})
+
+    i = 1
+    for chrmID in chrmIDL:
+        chrmSW = chrmSWs(chrmID)
+        x, y, yT = chrmSW['sw_Str'].tolist(), chrmSW['sSNP'].tolist(), chrmSW['toatalSNP'].tolist()
+        yRatio, sg_yRatio = chrmSW[r'sSNP/totalSNP'].tolist(), chrmSW['smthedRatio'].to_numpy()
+        plotSP = 1
+
+        # The subplots of the chromosome: a single column if only one chromosome is plotted
+        colAxs = axs if len(chrmIDL) == 1 else axs[:, i-1]
+
+        # Set up x-ticks
+        colAxs[0].set_xticks(np.arange(0, max(x), 10000000))
+        ticks = colAxs[0].get_xticks()*1e-7
+        colAxs[0].set_xticklabels(ticks.astype(int))
+
+        # Add ylabels to the first column of the subplots
+        if i==1:
+            colAxs[0].set_ylabel('Number of SNPs')
+            colAxs[1].set_ylabel(r'sSNP/totalSNP')
+
+        # SNP plot
+        colAxs[0].plot(x, y, c='k')
+        colAxs[0].plot(x, yT, c='b')
+        colAxs[0].set_title('Chr'+chrmID)
+
+        # sSNP/totalSNP plot
+        if smoothing == True:
+            colAxs[1].plot(x, sg_yRatio, c='k')
+        else:
+            colAxs[1].plot(x, yRatio, c='k')
+
+        # Add the 99.5 percentile line as threshold, x[-1] is the midpoint of the last sliding window of a chromosome
+        if swThrshldMode == True:
+            colAxs[1].plot(x, chrmSW['Threshold'].tolist(), c='r')
+        else:
+            colAxs[1].plot([plotSP, x[-1]], [thrshld, thrshld], c='r')
+
+        i += 1
+
+    # Handle the plot with a single column (chromosome)
+    if len(chrmIDL) == 1:
+        fig.align_ylabels(axs[:])
+    # Handle the plot with multiple columns (chromosomes)
+    else:
+        fig.align_ylabels(axs[:, 0])
+
+    # fig.tight_layout(pad=0.15, rect=[0, 0.035, 1, 1])
+    fig.subplots_adjust(top=0.96, bottom=0.073, left=0.064, right=0.995, hspace=hGap, wspace=wGap)
+    fig.suptitle('Genomic position (\u00D710 Mb)', y=0.002, ha='center', va='bottom')
+    fig.text(0.001, 0.995, 'a', weight='bold', ha='left', va='top')
+    fig.text(0.001, 0.435, 'b', weight='bold', ha='left', va='bottom')
+
+    fig.savefig(os.path.join(results, 'PyBSASeq.pdf'))
+    # fig.savefig(os.path.join(results, 'PyBSASeq.png'), dpi=600)
+    plt.close(fig)
+
     print(f'Plotting completed, time elapsed: {(time.time()-t0)/60} minutes')
 
 
@@ -470,347 +1651,852 @@ def pkList(l):
     return peakList
 
 
-def accurateThreshold_sw(l):
-    peaks = []
-    for subL in l:
-        peakSW = snpDF[(snpDF.CHROM == subL[0]) & (snpDF.POS >= subL[1]) & (snpDF.POS <= subL[1]+swSize-1)]
-        sSNP_PeakSW = peakSW[peakSW.FE_P<alpha]
+def chrmPeaks(chrmID, swStrL):
+    '''
+    The SNPs of the peak sliding windows starting at swStrL are located via binary search in the SNPs of the
+    chromosome sorted by position, and the thresholds of all the peaks are simulated together. Peaks with identical
+    locus depths share a simulated sliding window, which has its own random number stream derived from the stream of
+    the chromosome and its locus depths, so its threshold does not depend on the other peaks of the chromosome
+    '''
+    chT = chrmSNPs(chrmID)
+    posArr, sigArr = chT['POS'].to_numpy(), chT['FE_P'].to_numpy() < alpha
+    fbLDArr, sbLDArr = chT[fb_LD].to_numpy(dtype=np.int64), chT[sb_LD].to_numpy(dtype=np.int64)
+
+    chrmSeed = chrmSeedSeq(smSeedSeq, chrmID)
+    peaks, profileDict, profileL, profileIdxL, seedL = [], {}, [], [], []
+    loArr, hiArr = regionBounds(posArr, np.array(swStrL), np.array(swStrL)+swSize-1)
+    for swStr, lo, hi in zip(swStrL, loArr, hiArr):
 
-        sSNP, totalSNP = len(sSNP_PeakSW.index), len(peakSW.index)
+        sSNP, totalSNP = int(sigArr[lo:hi].sum()), int(hi - lo)
         ratio = sSNP / totalSNP
 
-        peaks.append([subL[0], subL[1], int(peakSW[fb_LD].mean()), int(peakSW[sb_LD].mean()), sSNP, totalSNP, ratio, smThresholds_sw(peakSW)[1]])
+        peaks.append([chrmID, swStr, int(fbLDArr[lo:hi].mean()), int(sbLDArr[lo:hi].mean()), sSNP, totalSNP, ratio])
 
-    headerResults = ['CHROM','sw_Str', fbID+'.AvgLD', sbID+'.AvgLD', 'sSNP', 'totalSNP', r'sSNP/totalSNP', 'Threshold']
-    pd.DataFrame(peaks, columns=headerResults).to_csv(os.path.join(results, args['output']), index=False)
+        # The null distribution of the ratio depends only on the multiset of locus depth pairs of the sliding window
+        profile = np.sort(fbLDArr[lo:hi]*2**32 + sbLDArr[lo:hi]).tobytes()
+        if profile not in profileDict:
+            profileDict[profile] = len(profileL)
+            profileL.append((fbLDArr[lo:hi], sbLDArr[lo:hi]))
+            seedL.append(keySeedSeq(chrmSeed, profile))
+        profileIdxL.append(profileDict[profile])
 
+    segArr = np.cumsum([0] + [len(fbLD) for fbLD, __ in profileL[:-1]])
+    fbCat = np.concatenate([fbLD for fbLD, __ in profileL])
+    sbCat = np.concatenate([sbLD for __, sbLD in profileL])
+    swThrshldArr = smThresholds_sw(fbCat, sbCat, segArr, seedL)[1]
 
-def accurateThreshold_gw(l):
-    peaks = []
+    for subL, profileIdx in zip(peaks, profileIdxL):
+        subL.append(swThrshldArr[profileIdx])
+
+    return peaks
+
+
+def additionalPeakList(fileName):
+    '''
+    The sliding windows with the highest sSNP/totalSNP ratio in each of the genomic regions listed in fileName, one
+    region per line: chromosome ID, start, and end. The regions of each chromosome are located with a single binary
+    search in its sliding windows; regions on unselected chromosomes and sliding windows without SNPs are ignored
+    '''
+    regionDict = {}
+    with open(fileName, 'r') as inF:
+        for line in inF:
+            if not line.startswith('#') and line.strip() != '':
+                a = line.rstrip().split()
+                regionDict.setdefault(a[0], []).append([int(a[1]), int(a[2])])
+
+    peakL = []
+    for chrmID, regionL in regionDict.items():
+        if chrmID not in chrmIDL:
+            continue
+
+        chrmSW = chrmSWs(chrmID)
+        swStrArr = chrmSW['sw_Str'].to_numpy()
+        ratioArr = np.where(chrmSW['toatalSNP'].to_numpy() > 0, chrmSW[r'sSNP/totalSNP'].to_numpy(), -np.inf)
+        regionArr = np.array(regionL)
+        for lo, hi in zip(*regionBounds(swStrArr, regionArr[:, 0], regionArr[:, 1])):
+            if hi > lo and ratioArr[lo:hi].max() > -np.inf:
+                for swStr in swStrArr[lo:hi][ratioArr[lo:hi] == ratioArr[lo:hi].max()]:
+                    peakL.append([chrmID, int(swStr)])
+
+    return peakL
+
+
+def accurateThreshold_sw(l):
+    '''
+    The peaks of each chromosome are verified by chrmPeaks, and the results are saved in the stage cache, so the
+    peaks of a chromosome are simulated again only if its sliding windows or the peaks are changed
+    '''
+    chrmPeakDict = {}
     for subL in l:
-        peakSW = snpDF[(snpDF.CHROM == subL[0]) & (snpDF.POS >= subL[1]) & (snpDF.POS <= subL[1]+swSize-1)]
-        sSNP_PeakSW = peakSW[peakSW.FE_P<alpha]
+        chrmPeakDict.setdefault(subL[0], []).append(int(subL[1]))
 
-        sSNP, totalSNP = len(sSNP_PeakSW.index), len(peakSW.index)
-        ratio = sSNP / totalSNP
+    peaks = []
+    for chrmID, swStrL in chrmPeakDict.items():
+        peakParams = {'windows': swKeys[chrmID], 'peaks': swStrL, 'smalpha': smAlpha, 'replication': rep, 'adaptive': adaptiveRep,
+            'tolerance': smTolerance if adaptiveRep == True else None}
+        peakKey = stageKey('peaks', peakParams)
+        peakResults = stageLoad(peakKey)
 
-        peaks.append([subL[0], subL[1], int(peakSW[fb_LD].mean()), int(peakSW[sb_LD].mean()), sSNP, totalSNP, ratio, thrshld])
+        if peakResults is None:
+            peakResults = {'peaks': chrmPeaks(chrmID, swStrL)}
+            stageSave(peakKey, peakParams, peakResults)
+
+        peaks.extend(peakResults['peaks'])
 
     headerResults = ['CHROM','sw_Str', fbID+'.AvgLD', sbID+'.AvgLD', 'sSNP', 'totalSNP', r'sSNP/totalSNP', 'Threshold']
-    pd.DataFrame(peaks, columns=headerResults).to_csv(os.path.join(results, args['output']), index=False)
+    queueOutput(resultFile(args['output']), writeTable, pd.DataFrame(peaks, columns=headerResults), resultFile(args['output']))
 
 
+# Start time of the run, reset by setup
 t0 = time.time()
 
-# Font settings for plotting
-plt.rc('font', family='Arial', size=22)     # controls default text sizes
-plt.rc('axes', titlesize=22)                # fontsize of the axes title
-plt.rc('axes', labelsize=22)                # fontsize of the x and y labels
-plt.rc('xtick', labelsize=20)               # fontsize of the tick labels
-plt.rc('ytick', labelsize=20)               # fontsize of the tick labels
-plt.rc('legend', fontsize=20)               # legend fontsize
-plt.rc('figure', titlesize=22)              # fontsize of the figure title
-# plt.tick_params(labelsize=20)
-
-# Construct the argument parser and parse the arguments
-ap = argparse.ArgumentParser()
-ap.add_argument('-i', '--input', required=False, help='file name of the GATK4-generated tsv file', default='snp100SE.tsv')
-ap.add_argument('-o', '--output', required=False, help='file name of the output csv file', default='BSASeq.csv')
-ap.add_argument('-f', '--fbsize', type=int, required=False, help='number of individuals in the first bulk', default=430)
-ap.add_argument('-s', '--sbsize', type=int, required=False, help='number of individuals in the second bulk', default=385)
-ap.add_argument('-p', '--popstrct', required=False, choices=['F2','RIL','BC'], help='population structure', default='F2')
-ap.add_argument('--alpha', type=float, required=False, help='p-value for fisher\'s exact test', default=0.01)
-ap.add_argument('--smalpha', type=float, required=False, help='p-value for calculating threshold', default=0.1)
-ap.add_argument('-r', '--replication', type=int, required=False, help='the number of replications for threshold calculation', default=10000)
-ap.add_argument('--swsize', type=int, required=False, help='sliding windows size', default=2000000)
-ap.add_argument('--step', type=int, required=False, help='incremental step', default=10000)
-ap.add_argument('--hgap', type=float, required=False, help='distance between rows of subplots', default=0.028)
-ap.add_argument('--wgap', type=float, required=False, help='distance between columns of subplots', default=0.092)
-ap.add_argument('--smthwl', type=int, required=False, help='window lenght of the smoothing window', default=51)
-ap.add_argument('--polyorder', type=int, required=False, help='the order of the polynomial used to fit the samples', default=5)
-ap.add_argument('--smooth', type=bool, required=False, help='smooth the plot', default=False)
-# ap.add_argument('--regstart', type=int, required=False, help='start of interested region', default=0)
-# ap.add_argument('--regend', type=int, required=False, help='end of interested region', default=0)
-
-args = vars(ap.parse_args())
-
-popStr = args['popstrct']
-rep = args['replication']
-fb_Size, sb_Size = args['fbsize'], args['sbsize']
-alpha, smAlpha = args['alpha'], args['smalpha']
-swSize, incrementalStep = args['swsize'], args['step']
-hGap, wGap = args['hgap'], args['wgap']
-smoothing = args['smooth']
-smthWL, polyOrder = args['smthwl'], args['polyorder']
-# regStart, regEnd = args['regstart'], args['regend']
-
-fb_Freq = smAlleleFreq(popStr, fb_Size, rep)
-sb_Freq = smAlleleFreq(popStr, sb_Size, rep)
-
-path = os.getcwd()
-inFile, oiFile = os.path.join(path, args['input']), os.path.join(path, 'snp_SE_fe.csv')
-currentDT = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-results = os.path.join(path, 'Results', currentDT)
-filteringPath = os.path.join(path, 'FilteredSNPs')
-
-if not os.path.exists(results):
-    os.makedirs(results)
-
-if not os.path.exists(filteringPath):
-    os.makedirs(filteringPath)
-
-# Generte a SNP dataframe from the GATK4-generated tsv file
-snpRawDF = pd.read_csv(inFile, delimiter='\t', encoding='utf-8', dtype={'CHROM':str})
-
-# Create a chromosome list, which can be very long because of the unmapped fragments
-chrmRawList = list(set(snpRawDF['CHROM'].tolist()))
-
-# Filter out chromosomes and unmapped fragments smaller than the sliding window
-# Make the chromosome list more readable and meaningful
-chrmList = chrmFiltering(snpRawDF, chrmRawList)[1]
-chrmList.sort()
-
-print(chrmList)
-print('\n')
-print(f'Above is the chromosome list, from which you can select the chromosome name(s) for the next step. Chromosomes or unmapped fragments smaller than the sliding window ({swSize} bp) are filtered out. Adjust the sliding window size with option \'--swsize\' to include desired small chromosomes.\n')
-
-# Print the chromosome list on the screen to let the user to select desired chromosome(s)
-rightInput = ''
-while rightInput.lower() != 'yes':
-    inputString = input('Enter chromosome names in order and separate each name with a comma:\n')
-    chrmIDL = [x.strip() for x in inputString.split(',')]
-    print('Sorted chromosome list:')
-    print(chrmIDL)
-    rightInput = input('Are the chromosome names in the above list in the right order (yes or no)?\n')
-
-print('\n\'no\' should be the answer for the question below if the script is run the first time.\n')
-
-additionalPeaks = input('Do you want to have additional peaks identified (yes or no)?\n')
-
-# Filter out possible wrong chromosome name(s) and chromosomes smaller than the sliding window
-# Create a list containing the sizes of all the chromosomes
-chrmCheck = chrmFiltering(snpRawDF, chrmIDL)
-chrmSzL, chrmIDL = chrmCheck[0], chrmCheck[1]
-
-if chrmIDL == []:
-    print('An invalid chromosome name was entered')
-    sys.exit()
-
-# Create a numeric ID for each chromosome, which can be used to sort the dataframe numerically by chromosome
-chrmDict = {}
-
-for i in range(1, len(chrmIDL)+1):
-    chrmDict[chrmIDL[i-1]] = i
-
-snpRawDF['ChrmSortID'] = snpRawDF['CHROM']
-snpRawDF['ChrmSortID'].replace(chrmDict, inplace=True)
-
-header = snpRawDF.columns.values.tolist()
-
-# Obtain the bulk IDs from the header
-bulks, misc, missingFlds = [], [], False 
-
+# The module 'fisher' is used if it is installed, otherwise the built-in Fisher's exact test is used
 try:
-    for ftrName in header:
-        if ftrName.endswith('.AD'):
-            bulks.append(ftrName.split('.')[0])
-
-    fbID, sbID = bulks[0], bulks[1]
-    fb_AD, sb_AD = fbID+'.AD', sbID+'.AD'
-    fb_GQ, sb_GQ = fbID+'.GQ', sbID+'.GQ'
-except (NameError, IndexError):
-    print('The allele depth (AD) field is missing. Please include the AD field in the input file.')
-    sys.exit()
-
-# Check if any required field is missing in the input file
-requiredFields = ['CHROM', 'POS', 'REF', 'ALT', fb_AD, fb_GQ, sb_AD, sb_GQ]
-missingFields = []
-
-for elmt in requiredFields:
-    if elmt not in header:
-        missingFields.append(elmt)
-
-if missingFields !=[]:
-    if len(missingFields) == 1:
-        print('The following required field is missing: ', missingFields)
-    else:
-        print('The following required fields are missing: ', missingFields)
+    from fisher import pvalue_npy
+except ImportError:
+    pvalue_npy = fisherExact_npy
+
+# The module 'zstandard' is needed to save the outputs in the zstd format. Only its presence is checked here, it is
+# imported by pandas when the first zstd file is written
+zstdAvailable = importlib.util.find_spec('zstandard') is not None
+
+# The multi-threaded pyarrow CSV engine is used to read the input file if it is installed; it is imported by pandas
+# when the input file is read
+csvEngine = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
+
+def argParser():
+    # Construct the argument parser
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-i', '--input', required=False, help='file name of the GATK4-generated tsv file', default='snp100SE.tsv')
+    ap.add_argument('-o', '--output', required=False, help='file name of the output csv file', default='BSASeq.csv')
+    ap.add_argument('-f', '--fbsize', type=int, required=False, help='number of individuals in the first bulk', default=430)
+    ap.add_argument('-s', '--sbsize', type=int, required=False, help='number of individuals in the second bulk', default=385)
+    ap.add_argument('-p', '--popstrct', required=False, choices=['F2','RIL','BC'], help='population structure', default='F2')
+    ap.add_argument('--alpha', type=float, required=False, help='p-value for fisher\'s exact test', default=0.01)
+    ap.add_argument('--smalpha', type=float, required=False, help='p-value for calculating threshold', default=0.1)
+    ap.add_argument('--exact', action='store_true', help='calculate the genome-wide threshold analytically instead of via simulation')
+    ap.add_argument('-r', '--replication', type=int, required=False, help='the number of replications for threshold calculation', default=10000)
+    ap.add_argument('--swthreshold', action='store_true', help='calculate a threshold for each sliding window and use it to identify the QTLs')
+    ap.add_argument('--adaptive', action='store_true', help='stop the threshold simulation once the 99.5th percentile is precise enough, with the number of replications as the maximum')
+    ap.add_argument('--tolerance', type=float, required=False, help='width of the confidence interval of the 99.5th percentile at which the adaptive simulation stops', default=0.005)
+    ap.add_argument('-j', '--jobs', type=int, required=False, help='the number of processes used for threshold calculation and for the sliding window analysis of the chromosomes', default=1)
+    ap.add_argument('--seed', type=int, required=False, help='seed of the random number generator, a random seed is used if not given', default=None)
+    ap.add_argument('--chunksize', type=int, required=False, help='read the input file in chunks of this number of rows and store the SNPs by chromosome, 0 to read the entire file at once', default=0)
+    ap.add_argument('--csv', action='store_true', help='save the results of Fisher\'s exact test in csv files as well')
+    ap.add_argument('--cachesize', type=int, required=False, help='size limit (MB) of the stage cache, 0 for no limit', default=10240)
+    ap.add_argument('--filteredformat', required=False, choices=['csv', 'csv.gz', 'csv.zst', 'codes'], help='format of the files of the filtered SNPs, \'codes\' records only the row numbers of the SNPs in the input file and the codes of their categories', default='csv.gz')
+    ap.add_argument('--resultformat', required=False, choices=['csv', 'csv.gz', 'csv.zst'], help='format of the result tables', default='csv')
+    ap.add_argument('--writers', type=int, required=False, help='number of background threads writing the output files', default=2)
+    ap.add_argument('--membudget', type=int, required=False, help='memory budget (MB) of a chunk of simulated replications', default=1024)
+    ap.add_argument('--swsize', type=int, required=False, help='sliding windows size', default=2000000)
+    ap.add_argument('--step', type=int, required=False, help='incremental step', default=10000)
+    ap.add_argument('--swsizes', required=False, help='sliding window sizes separated by commas; the sliding windows of all the combinations of the sizes and the incremental steps (\'--steps\') are calculated in a single run and saved in swSweep.csv, without plotting and peak verification', default=None)
+    ap.add_argument('--steps', required=False, help='incremental steps of the sweep separated by commas, \'--step\' if not given', default=None)
+    ap.add_argument('--hgap', type=float, required=False, help='distance between rows of subplots', default=0.028)
+    ap.add_argument('--wgap', type=float, required=False, help='distance between columns of subplots', default=0.092)
+    ap.add_argument('--smthwl', type=int, required=False, help='window lenght of the smoothing window', default=51)
+    ap.add_argument('--polyorder', type=int, required=False, help='the order of the polynomial used to fit the samples', default=5)
+    ap.add_argument('--smooth', type=bool, required=False, help='smooth the plot', default=False)
+    ap.add_argument('--noplot', action='store_true', help='skip plotting; matplotlib is not loaded')
+    ap.add_argument('--workdir', required=False, help='folder of the stage cache and the output folders, the current directory if not given', default=None)
+    ap.add_argument('--name', required=False, help='name of the folder of the results in the folder \'Results\', the date and time of the run if not given', default=None)
+    ap.add_argument('--batch', required=False, help='TOML or YAML manifest of the jobs of a batch, each job containing the options that differ from the command line; the jobs are run by a pool of \'--jobs\' processes', default=None)
+    # ap.add_argument('--regstart', type=int, required=False, help='start of interested region', default=0)
+    # ap.add_argument('--regend', type=int, required=False, help='end of interested region', default=0)
+
+    ap.add_argument('--chromosomes', required=False, help='names of the chromosomes in the order of the plot separated by commas, or \'all\' for all the chromosomes larger than the sliding window; the script runs without any prompt if given', default=None)
+    ap.add_argument('--peaks', required=False, help='file of the genomic regions in which additional peaks are identified, in the format of additionalPeaks.txt', default=None)
+    ap.add_argument('--config', required=False, help='TOML or YAML run configuration file containing the options by their long names; options given in the command line take precedence', default=None)
+
+    return ap
+
+
+def checkName(name):
+    # The name of the folder of the results should be a single folder name in the folder 'Results'
+    if name in ['', '.', '..'] or os.sep in name or (os.altsep is not None and os.altsep in name):
+        print(f'Invalid name of the folder of the results: \'{name}\'')
+        sys.exit(1)
+
+    return name
+
+
+def parseArgs(argv=None):
+    '''
+    Parse the command line options in argv (sys.argv[1:] if None), e.g. ['-i', 'snp.tsv', '--chromosomes', 'all'].
+    Return a dictionary of the options with their long names as its keys
+    '''
+    ap = argParser()
+    args = vars(ap.parse_args(argv))
+
+    # The options in the run configuration file replace the defaults of the options
+    if args['config'] is not None:
+        ap.set_defaults(**runConfig(args['config'], ap))
+        args = vars(ap.parse_args(argv))
+
+    return args
 
-    print('Please remake the input file to include the missing field(s).')
-    sys.exit()
 
-misc.append(['Header', header])
-misc.extend([['Bulk ID', bulks], ['Number of SNPs in the entire dataframe', len(snpRawDF.index)]])
-misc.extend([['Chromosome ID', chrmIDL]])
-misc.append(['Chromosome sizes', chrmSzL])
+def setup(argDict):
+    '''
+    Set up a run with the options in argDict (parseArgs): the parameters, the random number streams, the output
+    folders in the working directory ('--workdir', the current directory by default), and the writer threads. The state of the run is kept in the module
+    so it is inherited by the worker processes of the threshold calculation
+    '''
+    global t0, args, misc, usedStages
+    global popStr, rep, fb_Size, sb_Size, alpha, smAlpha, swSize, incrementalStep, hGap, wGap, smoothing
+    global exactThrshld, adaptiveRep, smTolerance, swThrshldMode, smthWL, polyOrder
+    global smMemBudget, chunkSize, csvExport, cacheBudget, filteredFormat, resultFormat, outputPools, outputFutures
+    global rootSeedSeq, rngSeedSeq, smSeedSeq, rng, numOfJobs, fb_Freq, sb_Freq
+    global path, inFile, oiFile, cachePath, currentDT, results, filteringPath, partitionPath
+
+    t0 = time.time()
+    args, misc = argDict, []
+
+    popStr = args['popstrct']
+    rep = args['replication']
+    fb_Size, sb_Size = args['fbsize'], args['sbsize']
+    alpha, smAlpha = args['alpha'], args['smalpha']
+    swSize, incrementalStep = args['swsize'], args['step']
+    hGap, wGap = args['hgap'], args['wgap']
+    smoothing = args['smooth']
+    exactThrshld = args['exact']
+    adaptiveRep, smTolerance = args['adaptive'], args['tolerance']
+    swThrshldMode = args['swthreshold']
+    smthWL, polyOrder = args['smthwl'], args['polyorder']
+    # regStart, regEnd = args['regstart'], args['regend']
+
+    smMemBudget = args['membudget'] * 2**20
+    chunkSize = args['chunksize']
+    csvExport = args['csv']
+    cacheBudget = args['cachesize'] * 2**20
+    filteredFormat, resultFormat = args['filteredformat'], args['resultformat']
+
+    # The output files are written by background threads in the formats set with '--filteredformat' and '--resultformat'
+    if zstdAvailable == False and 'csv.zst' in [filteredFormat, resultFormat]:
+        print('The module \'zstandard\' is not installed, the gzip format is used instead of the zstd format.')
+        filteredFormat = 'csv.gz' if filteredFormat == 'csv.zst' else filteredFormat
+        resultFormat = 'csv.gz' if resultFormat == 'csv.zst' else resultFormat
+
+    outputPools = [ThreadPoolExecutor(max_workers=1) for __ in range(max(1, args['writers']))]
+    outputFutures = []
+
+    # All the random numbers of a run are derived from a single seed: one stream for the allele frequencies and the
+    # simulated reads of the SNPs, and one stream per block of simulated replications
+    rootSeedSeq = np.random.SeedSequence(args['seed'])
+    rngSeedSeq, smSeedSeq = rootSeedSeq.spawn(2)
+    rng = np.random.default_rng(rngSeedSeq)
+
+    # Worker processes inherit the state of the run by forking, which is not available on all platforms
+    numOfJobs = max(1, args['jobs'])
+    if numOfJobs > 1 and 'fork' not in mp.get_all_start_methods():
+        print('Parallel threshold calculation is not supported on this platform, a single process is used.')
+        numOfJobs = 1
+
+    fb_Freq = smAlleleFreq(popStr, fb_Size, rep)
+    sb_Freq = smAlleleFreq(popStr, sb_Size, rep)
+
+    # The input file is relative to the current directory, the output folders to the working directory
+    path = os.getcwd() if args['workdir'] is None else os.path.abspath(args['workdir'])
+    inFile, oiFile = os.path.abspath(args['input']), os.path.join(path, 'snp_SE_fe.csv')
+    cachePath = os.path.join(path, 'StageCache')
+    currentDT = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    filteringPath = os.path.join(path, 'FilteredSNPs')
+    partitionPath = os.path.join(path, 'SNPPartitions')
+
+    # The results are saved in the folder named with '--name', whose files written by an earlier run are replaced, or in
+    # a new folder named after the date and time of the run, with a suffix if another run has created the folder in the
+    # same second
+    if args['name'] is not None:
+        results = os.path.join(path, 'Results', checkName(args['name']))
+        os.makedirs(results, exist_ok=True)
+        for fileName in resultFileNames + [args['output']]:
+            for ext in set(fmtExt.values()):
+                if os.path.isfile(os.path.join(results, fileName + ext)):
+                    os.remove(os.path.join(results, fileName + ext))
+    else:
+        results, n = os.path.join(path, 'Results', currentDT), 1
+        while True:
+            try:
+                os.makedirs(results)
+                break
+            except FileExistsError:
+                results, n = os.path.join(path, 'Results', f'{currentDT}_{n}'), n + 1
 
-fb_SI, sb_SI = fbID+'.SI', sbID+'.SI'
-fb_AD_REF, fb_AD_ALT = fb_AD + '_REF', fb_AD + '_ALT'
-sb_AD_REF, sb_AD_ALT = sb_AD + '_REF', sb_AD + '_ALT'
-fb_LD, sb_LD = fbID+'.LD', sbID+'.LD'
-sm_fb_AD_REF, sm_fb_AD_ALT = 'sm_'+fb_AD_REF, 'sm_'+fb_AD_ALT
-sm_sb_AD_REF, sm_sb_AD_ALT = 'sm_'+sb_AD_REF, 'sm_'+sb_AD_ALT
+    if not os.path.exists(filteringPath):
+        os.makedirs(filteringPath)
 
-if os.path.isfile(os.path.join(path, 'COMPLETE.txt')) == False:
-    snpFiltering(snpRawDF)
+    if not os.path.exists(cachePath):
+        os.makedirs(cachePath)
 
-    # Obtain REF reads, ALT reads, and locus reads of each SNP
-    snpDF[[fb_AD_REF, fb_AD_ALT]] = snpDF[fb_AD].str.split(',', expand=True).astype(int)
-    snpDF[fb_LD] = snpDF[fb_AD_REF] + snpDF[fb_AD_ALT]
+    if chunkSize != 0 and not os.path.exists(partitionPath):
+        os.makedirs(partitionPath)
 
-    snpDF[[sb_AD_REF, sb_AD_ALT]] = snpDF[sb_AD].str.split(',', expand=True).astype(int)
-    snpDF[sb_LD] = snpDF[sb_AD_REF] + snpDF[sb_AD_ALT]
+    # Each stage of the pipeline is saved in the stage cache, and is recalculated only if the input file or a parameter
+    # the stage depends on is changed. Keys of the stages used in this run, which are not evicted
+    usedStages = set()
 
-    snpRep = snpDF[(snpDF[fb_LD]>400) | (snpDF[sb_LD]>400)]
-    snpRep.to_csv(os.path.join(filteringPath, 'repetitiveSeq.csv'), index=None)
 
-    snpDF = snpDF[(snpDF[fb_LD]<=400) | (snpDF[sb_LD]<=400)]
+def ingest():
+    '''
+    Read the header and the required fields of the input file, and build the chromosome index (chrmIndex). If the file
+    is read in chunks, only the index is built here
+    '''
+    global header, bulks, fbID, sbID, fb_AD, sb_AD, fb_GQ, sb_GQ, requiredFields
+    global fb_SI, sb_SI, fb_AD_REF, fb_AD_ALT, sb_AD_REF, sb_AD_ALT, fb_LD, sb_LD
+    global sm_fb_AD_REF, sm_fb_AD_ALT, sm_sb_AD_REF, sm_sb_AD_ALT
+    global snpRawDF, chrmIdx, numOfSNPs, chrmList
 
-    # Filter out the SNPs with zero locus reads in either bulk
-    snpDF_0LD = snpDF[~((snpDF[fb_LD]>0) & (snpDF[sb_LD]>0))]
-    snpDF = snpDF[(snpDF[fb_LD]>0) & (snpDF[sb_LD]>0)]
-    snpDF_0LD.to_csv(os.path.join(filteringPath, '0ld.csv'), index=None)
+    # Read the header of the GATK4-generated tsv file
+    header = pd.read_csv(inFile, delimiter='\t', encoding='utf-8', nrows=0).columns.values.tolist()
 
-    # Calculate simulated ALT reads for each SNP under null hypothesis
-    snpDF[sm_fb_AD_ALT] = np.random.binomial(snpDF[fb_LD], fb_Freq)
-    snpDF[sm_fb_AD_REF] = snpDF[fb_LD] - snpDF[sm_fb_AD_ALT]
-    snpDF[sm_sb_AD_ALT] = np.random.binomial(snpDF[sb_LD], sb_Freq)
-    snpDF[sm_sb_AD_REF] = snpDF[sb_LD] - snpDF[sm_sb_AD_ALT]
+    # Obtain the bulk IDs from the header
+    bulks = []
 
     try:
-        from fisher import pvalue_npy
-        # Create new columns for Fisher's exact test P-values and simulated P-values
-        print('Perform Fisher\'s exact test.')
-        fb_AD_ALT_Arr = snpDF[fb_AD_ALT].to_numpy(dtype=np.uint)
-        fb_AD_REF_Arr = snpDF[fb_AD_REF].to_numpy(dtype=np.uint)
-        sb_AD_ALT_Arr = snpDF[sb_AD_ALT].to_numpy(dtype=np.uint)
-        sb_AD_REF_Arr = snpDF[sb_AD_REF].to_numpy(dtype=np.uint)
-
-        __, __, snpDF['FE_P'] = pvalue_npy(fb_AD_ALT_Arr, fb_AD_REF_Arr, sb_AD_ALT_Arr, sb_AD_REF_Arr)
-        # snpDF['FE_OR'] = (fb_AD_ALT_Arr * sb_AD_REF_Arr) / (fb_AD_REF_Arr * sb_AD_ALT_Arr)
-
-        sm_fb_AD_ALT_Arr = snpDF[sm_fb_AD_ALT].to_numpy(dtype=np.uint)
-        sm_fb_AD_REF_Arr = snpDF[sm_fb_AD_REF].to_numpy(dtype=np.uint)
-        sm_sb_AD_ALT_Arr = snpDF[sm_sb_AD_ALT].to_numpy(dtype=np.uint)
-        sm_sb_AD_REF_Arr = snpDF[sm_sb_AD_REF].to_numpy(dtype=np.uint)
-
-        __, __, snpDF['sm_FE_P'] = pvalue_npy(sm_fb_AD_ALT_Arr, sm_fb_AD_REF_Arr, sm_sb_AD_ALT_Arr, sm_sb_AD_REF_Arr)
-        # snpDF['sm_FE_OR'] = (sm_fb_AD_ALT_Arr * sm_sb_AD_REF_Arr) / (sm_fb_AD_REF_Arr * sm_sb_AD_ALT_Arr)
-
-    except ImportError:
-        from scipy.stats import fisher_exact
-        print('Perform Fisher\'s exact test. This step can take a few hours; the more SNPs in the dataset or the higher the sequencing depth, the longer will it take.')
-        snpDF['STAT'] = snpDF.apply(statistics, axis=1)
-        # Create new columns for Fisher's exact test results
-        snpDF[['fisher_exact', 'sm_FE']] = pd.DataFrame(snpDF.STAT.values.tolist(), index=snpDF.index)
-
-        # Create new columns for Fisher's exact test P-values or simulated P-values
-        snpDF['FE_P'] = snpDF['fisher_exact'].apply(lambda x: x[1]).astype(float)
-        snpDF['sm_FE_P'] = snpDF['sm_FE'].apply(lambda x: x[1]).astype(float)
-
-    print(f'Fisher\'s exact test completed, time elapsed: {(time.time()-t0)/60} minutes')
+        for ftrName in header:
+            if ftrName.endswith('.AD'):
+                bulks.append(ftrName.split('.')[0])
+
+        fbID, sbID = bulks[0], bulks[1]
+        fb_AD, sb_AD = fbID+'.AD', sbID+'.AD'
+        fb_GQ, sb_GQ = fbID+'.GQ', sbID+'.GQ'
+    except (NameError, IndexError):
+        print('The allele depth (AD) field is missing. Please include the AD field in the input file.')
+        sys.exit(1)
+
+    # Check if any required field is missing in the input file
+    requiredFields = ['CHROM', 'POS', 'REF', 'ALT', fb_AD, fb_GQ, sb_AD, sb_GQ]
+    missingFields = []
+
+    for elmt in requiredFields:
+        if elmt not in header:
+            missingFields.append(elmt)
+
+    if missingFields !=[]:
+        if len(missingFields) == 1:
+            print('The following required field is missing: ', missingFields)
+        else:
+            print('The following required fields are missing: ', missingFields)
+
+        print('Please remake the input file to include the missing field(s).')
+        sys.exit(1)
+
+    fb_SI, sb_SI = fbID+'.SI', sbID+'.SI'
+    fb_AD_REF, fb_AD_ALT = fb_AD + '_REF', fb_AD + '_ALT'
+    sb_AD_REF, sb_AD_ALT = sb_AD + '_REF', sb_AD + '_ALT'
+    fb_LD, sb_LD = fbID+'.LD', sbID+'.LD'
+    sm_fb_AD_REF, sm_fb_AD_ALT = 'sm_'+fb_AD_REF, 'sm_'+fb_AD_ALT
+    sm_sb_AD_REF, sm_sb_AD_ALT = 'sm_'+sb_AD_REF, 'sm_'+sb_AD_ALT
+
+    # Generte a SNP dataframe from the required fields of the GATK4-generated tsv file. If the file is read in chunks,
+    # only the size of each chromosome is obtained here. The table is not read again if the file is unchanged since the
+    # last run in this process; the table is not modified by the later stages, but the chromosome index is
+    fileStat = os.stat(inFile)
+    tableKey = (inFile, fileStat.st_size, fileStat.st_mtime_ns, chunkSize)
+    if tableKey not in snpTables:
+        snpTables.clear()
+        if chunkSize == 0:
+            snpRawDF = readSNPTable(inFile, requiredFields, [fb_AD, sb_AD])
+            snpTables[tableKey] = [snpRawDF, chrmIndex(snpRawDF), len(snpRawDF.index)]
+        else:
+            snpTables[tableKey] = [None] + chrmSizeTable(inFile, chunkSize)
 
-    # Remove unnecessary columns and reorgnaize the columns
-    reorderColumns = ['CHROM', 'POS', 'REF', 'ALT', fb_AD_REF, fb_AD_ALT, fb_LD, sm_fb_AD_ALT, fb_GQ, sb_AD_REF, sb_AD_ALT, sb_LD, sm_sb_AD_ALT, sb_GQ, 'FE_P', 'sm_FE_P']
+    snpRawDF, chrmIdx, numOfSNPs = snpTables[tableKey]
+    chrmIdx = chrmIdx.copy()
 
-    snpDF = snpDF[reorderColumns]
+    # Create a chromosome list, which can be very long because of the unmapped fragments
+    chrmRawList = chrmIdx.index.tolist()
 
-    snpDF.to_csv(oiFile, index=None)
+    # Filter out chromosomes and unmapped fragments smaller than the sliding window
+    # Make the chromosome list more readable and meaningful
+    chrmList = chrmFiltering(chrmRawList)[1]
+    chrmList.sort()
 
-    with open(os.path.join(path, 'COMPLETE.txt'), 'w') as xie:
-        xie.write('Statistical calculation is completed!')
-else:
-    snpDF = pd.read_csv(oiFile, dtype={'CHROM':str})
 
-# The above calculation may generate 'NA' value(s) for some SNPs. Remove SNPs with such 'NA' value(s)
-snpDF.dropna(inplace=True)
-misc.append(['Number of SNPs after drop of SNPs with calculation-generated NA value', len(snpDF.index)])
+def selectChromosomes(chromosomes=None, peakFileName=None):
+    '''
+    Select the chromosomes to be analyzed and the file of the regions of the additional peaks. chromosomes is a string
+    of chromosome names separated by commas or 'all'; if it is None, the chromosomes are selected interactively
+    '''
+    global chrmIDL, chrmSzL, additionalPeaks, peakFile
+
+    if chromosomes is None:
+        print(chrmList)
+        print('\n')
+        print(f'Above is the chromosome list, from which you can select the chromosome name(s) for the next step. Chromosomes or unmapped fragments smaller than the sliding window ({swSize} bp) are filtered out. Adjust the sliding window size with option \'--swsize\' to include desired small chromosomes.\n')
+
+        # Print the chromosome list on the screen to let the user to select desired chromosome(s)
+        rightInput = ''
+        while rightInput.lower() != 'yes':
+            inputString = input('Enter chromosome names in order and separate each name with a comma:\n')
+            chrmIDL = [x.strip() for x in inputString.split(',')]
+            print('Sorted chromosome list:')
+            print(chrmIDL)
+            rightInput = input('Are the chromosome names in the above list in the right order (yes or no)?\n')
+    elif chromosomes.strip().lower() == 'all':
+        # All the chromosomes larger than the sliding window, with numeric names sorted numerically
+        chrmIDL = sorted(chrmList, key=lambda x: (0, int(x), '') if x.isdigit() else (1, 0, x))
+    else:
+        chrmIDL = [x.strip() for x in chromosomes.split(',')]
 
-# Filter out SNPs with a low genotype quality score
-snpDF = snpDF[(snpDF[fb_GQ]>=20) & (snpDF[sb_GQ]>=20)]
+    # Additional peaks are identified in the regions listed in the file peakFileName, or in the file
+    # 'additionalPeaks.txt' if requested interactively
+    if peakFileName is not None:
+        additionalPeaks, peakFile = 'yes', os.path.abspath(peakFileName)
+    elif chromosomes is None:
+        print('\n\'no\' should be the answer for the question below if the script is run the first time.\n')
 
-misc.append(['Dataframe filtered with genotype quality scores', len(snpDF.index)])
+        additionalPeaks, peakFile = input('Do you want to have additional peaks identified (yes or no)?\n'), os.path.join(path, 'additionalPeaks.txt')
+    else:
+        additionalPeaks, peakFile = 'no', None
 
-# Calculate the average number of SNPs in a sliding window
-snpPerSW = int(len(snpDF.index) * swSize / sum(chrmSzL))
+    # Filter out possible wrong chromosome name(s) and chromosomes smaller than the sliding window
+    # Create a list containing the sizes of all the chromosomes
+    chrmCheck = chrmFiltering(chrmIDL)
+    chrmSzL, chrmIDL = chrmCheck[0], chrmCheck[1]
 
-misc.append(['Average SNPs per sliding window', snpPerSW])
-misc.append([f'Average locus depth in bulk {fbID}', snpDF[fb_LD].mean()])
-misc.append([f'Average locus depth in bulk {sbID}', snpDF[sb_LD].mean()])
+    if chrmIDL == []:
+        print('An invalid chromosome name was entered')
+        sys.exit(1)
 
-# Calculate or retrieve the threshold. The threshoslds are normally in the range from 0.12 to 0.12666668
-if os.path.isfile(os.path.join(path, 'threshold.txt')) == False:
-    if 'fisher' in sys.modules:
-        thrshld = smThresholds_gw(snpDF)[1]
+    # Create a numeric ID for each chromosome, which can be used to sort the dataframe numerically by chromosome
+    chrmIdx.loc[chrmIDL, 'SortID'] = np.arange(1, len(chrmIDL)+1)
+
+    misc.append(['Header', header])
+    misc.extend([['Bulk ID', bulks], ['Number of SNPs in the entire dataframe', numOfSNPs]])
+    misc.extend([['Chromosome ID', chrmIDL]])
+    misc.append(['Random seed', rootSeedSeq.entropy])
+    misc.append(['Chromosome sizes', chrmSzL])
+
+
+def filterAndTest():
+    '''
+    SNP filtering and Fisher's exact test of the selected chromosomes. The results of each chromosome are saved in the
+    stage cache, and the SNPs passing the filters are collected in snpDF, with the rows of each chromosome recorded in
+    chrmIdx
+    '''
+    global snpRawDF, snpDF, fisherKeys, fisherDirs, filteredDirs, filteredFiles
+
+    # SNP filtering and Fisher's exact test are performed by chromosome, and the results of a chromosome depend on the
+    # content of its SNPs in the input file, so only the chromosomes whose SNPs are changed are recalculated
+    fingerprintDict = chrmFingerprints(inFile, requiredFields)
+    fisherParamDict, fisherKeys, fisherDirs, ctgrDict = {}, {}, {}, {}
+    # The parameters besides the chromosome, the fields, and the filtering rules are the options in fisherOptions
+    for chrmID in chrmIDL:
+        fisherParamDict[chrmID] = {'input': fingerprintDict[chrmID], 'chromosome': chrmID, 'fields': requiredFields, 'fbsize': fb_Size,
+            'sbsize': sb_Size, 'popstrct': popStr, 'replication': rep, 'seed': args['seed'], 'chunksize': chunkSize,
+            'filters': {'minGQ': minGQ, 'maxLD': maxLD, 'maxLDBulks': 'either'}, 'filteredformat': filteredFormat}
+        fisherKeys[chrmID] = stageKey('fisher', fisherParamDict[chrmID])
+        fisherResults = stageLoad(fisherKeys[chrmID])
+
+        if fisherResults is None:
+            fisherDirs[chrmID] = stageBuildDir(fisherKeys[chrmID])
+        else:
+            fisherDirs[chrmID] = stageDir(fisherKeys[chrmID])
+            ctgrDict[chrmID] = fisherResults['ctgrCount']
+
+    updateL = [chrmID for chrmID in chrmIDL if chrmID not in ctgrDict]
+    filteredDirs, filteredFiles = {}, set()
+
+    # The unmapped SNPs are the SNPs of the chromosomes not selected, so they are saved again if the selection, the
+    # input file, or the format has changed since they were saved, even if all the selected chromosomes are reused
+    unmappedKey = stageKey('unmapped', {'input': fingerprintDict, 'chromosomes': sorted(chrmIDL), 'filteredformat': filteredFormat})
+    unmappedKeyFile = os.path.join(filteringPath, 'unmapped.key')
+    unmappedStale = True
+    if os.path.isfile(unmappedKeyFile):
+        with open(unmappedKeyFile, 'r') as du:
+            unmappedStale = du.read() != unmappedKey
+
+    if updateL != [] or unmappedStale == True:
+        # The filtered SNPs of the recalculated chromosomes are saved in their stage entries, and the unmapped SNPs are
+        # saved again
+        for chrmID in updateL:
+            filteredDirs[chrmID] = os.path.join(fisherDirs[chrmID], 'FilteredSNPs')
+            os.makedirs(filteredDirs[chrmID])
+            ctgrDict[chrmID] = np.zeros(len(snpCategories), dtype=np.int64)
+
+        for fileName in ['unmapped.key', 'unmapped.csv', 'unmapped.csv.gz', 'unmapped.csv.zst', 'filterCodes.bin']:
+            if os.path.isfile(os.path.join(filteringPath, fileName)):
+                os.remove(os.path.join(filteringPath, fileName))
+
+        chrmRNGDict = {chrmID: np.random.default_rng(chrmSeedSeq(rngSeedSeq, chrmID)) for chrmID in updateL}
+        if updateL == []:
+            print('Save the SNPs of the chromosomes not selected as unmapped SNPs.')
+
+        if chunkSize == 0:
+            snpRawDF = snpRawDF[snpRawDF['CHROM'].isin(updateL) | ~snpRawDF['CHROM'].isin(chrmIDL)].copy()
+            snpRawDF['ChrmSortID'] = snpRawDF['CHROM'].map(chrmIdx['SortID'])
+            ctgrDict.update(snpFiltering(snpRawDF))
+            print(f'SNP filtering completed, time elapsed: {(time.time()-t0)/60} minutes')
+
+            # The SNPs are sorted by chromosome, so the SNPs of a chromosome are located via binary search of its sort ID
+            if updateL != []:
+                print(f'Perform Fisher\'s exact test on chromosome(s) {updateL}')
+            sortIDArr = snpDF['ChrmSortID'].to_numpy()
+            for chrmID in updateL:
+                lo, hi = np.searchsorted(sortIDArr, chrmIdx.at[chrmID, 'SortID'], 'left'), np.searchsorted(sortIDArr, chrmIdx.at[chrmID, 'SortID'], 'right')
+                saveSNPCache(feTest(snpDF.iloc[lo:hi].copy(), chrmRNGDict[chrmID]), fisherDirs[chrmID], ['FE_P', 'sm_FE_P'])
+        else:
+            # Filter each chunk of the input file, perform Fisher's exact test, and append the SNPs to the partitions of
+            # their chromosomes
+            if updateL != []:
+                print(f'Perform SNP filtering and Fisher\'s exact test chunk by chunk on chromosome(s) {updateL}')
+            for chrmID in updateL:
+                if os.path.isfile(partitionFile(chrmID)):
+                    os.remove(partitionFile(chrmID))
+
+            for chunkDF in readSNPTable(inFile, requiredFields, [fb_AD, sb_AD], chunkSize):
+                chunkDF = chunkDF[chunkDF['CHROM'].isin(updateL) | ~chunkDF['CHROM'].isin(chrmIDL)].copy()
+                chunkDF['ChrmSortID'] = chunkDF['CHROM'].map(chrmIdx['SortID'])
+                for chrmID, chrmCount in snpFiltering(chunkDF).items():
+                    ctgrDict[chrmID] += chrmCount
+
+                for chrmID, chrmDF in snpDF.groupby('CHROM', sort=False):
+                    feTest(chrmDF.copy(), chrmRNGDict[chrmID]).to_csv(partitionFile(chrmID), index=None, mode='a', header=not os.path.isfile(partitionFile(chrmID)))
+
+            # Convert the partitions to the binary format once all the chunks are appended
+            for chrmID in updateL:
+                if os.path.isfile(partitionFile(chrmID)):
+                    saveSNPCache(pd.read_csv(partitionFile(chrmID), dtype={'CHROM':str, 'REF':str, 'ALT':str}), partitionDir(chrmID), ['FE_P', 'sm_FE_P'])
+                    if csvExport == False:
+                        os.remove(partitionFile(chrmID))
+
+        # The filtered SNPs are written to the build directories of the entries in the background
+        outputWait()
+        with open(unmappedKeyFile, 'w') as xie:
+            xie.write(unmappedKey)
+        for chrmID in updateL:
+            fisherDirs[chrmID] = stageSave(fisherKeys[chrmID], fisherParamDict[chrmID], {'ctgrCount': ctgrDict[chrmID]}, fisherDirs[chrmID])
+
+        print(f'Fisher\'s exact test completed, time elapsed: {(time.time()-t0)/60} minutes')
+
+    for chrmID in chrmIDL:
+        filteredLink(chrmID)
+
+    if chunkSize == 0 and csvExport == True:
+        pd.concat([loadSNPCache(partitionDir(chrmID)) for chrmID in chrmIDL], ignore_index=True).to_csv(oiFile, index=None)
+
+    # The SNPs of the unselected chromosomes are unmapped
+    ctgrCount = np.sum([ctgrDict[chrmID] for chrmID in chrmIDL], axis=0).tolist()
+    ctgrCount[snpCategories.index('Unmapped')] = numOfSNPs - sum(ctgrCount)
+    misc.append(['Number of SNPs after NA drop', numOfSNPs - ctgrCount[snpCategories.index('Unmapped')] - ctgrCount[snpCategories.index('NA')]])
+    misc.append(['Number of SNPs in each filtering category', dict(zip(snpCategories, ctgrCount))])
+
+    # The above calculation may generate 'NA' value(s) for some SNPs. Remove SNPs with such 'NA' value(s) and SNPs with a
+    # low genotype quality score. If the input file was ingested in chunks, only the locus depths of the SNPs are kept
+    # in memory for threshold calculation, and the other stages read the SNPs of one chromosome at a time
+    snpDFL, numOfNotNA = [], 0
+    for chrmID in chrmIDL:
+        if chunkSize == 0:
+            chrmDF = loadSNPCache(partitionDir(chrmID))
+            numOfNotNA += len(chrmDF.dropna().index)
+            snpDFL.append(qualityFiltering(chrmDF))
+        else:
+            chrmDF = loadSNPCache(partitionDir(chrmID), [fb_LD, sb_LD, 'FE_P', 'sm_FE_P'])
+            numOfNotNA += len(chrmDF.dropna().index)
+            snpDFL.append(qualityFiltering(chrmDF)[[fb_LD, sb_LD]].astype({fb_LD:np.int32, sb_LD:np.int32}))
+
+    # The SNPs of the chromosomes are in the order of chrmIDL, the rows of each chromosome are recorded in the index
+    snpDF = pd.concat(snpDFL, ignore_index=True)
+    chrmIdx.loc[chrmIDL, 'End'] = np.cumsum([len(chrmDF.index) for chrmDF in snpDFL])
+    chrmIdx.loc[chrmIDL, 'Start'] = chrmIdx.loc[chrmIDL, 'End'] - [len(chrmDF.index) for chrmDF in snpDFL]
+    misc.append(['Number of SNPs after drop of SNPs with calculation-generated NA value', numOfNotNA])
+
+    misc.append(['Dataframe filtered with genotype quality scores', len(snpDF.index)])
+
+
+def threshold():
+    '''
+    Calculate the genome-wide threshold of the sSNP/totalSNP ratio, or retrieve it from the stage cache.
+    Return the threshold
+    '''
+    global snpPerSW, thrshld
+
+    # Calculate the average number of SNPs in a sliding window
+    snpPerSW = int(len(snpDF.index) * swSize / sum(chrmSzL))
+
+    misc.append(['Average SNPs per sliding window', snpPerSW])
+    misc.append([f'Average locus depth in bulk {fbID}', snpDF[fb_LD].mean()])
+    misc.append([f'Average locus depth in bulk {sbID}', snpDF[sb_LD].mean()])
+
+    # Calculate or retrieve the threshold. The threshoslds are normally in the range from 0.12 to 0.12666668
+    thrshldParams = {'fisher': [fisherKeys[chrmID] for chrmID in chrmIDL], 'exact': exactThrshld, 'smalpha': smAlpha, 'swsize': swSize}
+    if exactThrshld == False:
+        thrshldParams.update({'adaptive': adaptiveRep, 'tolerance': smTolerance if adaptiveRep == True else None})
+    thrshldKey = stageKey('threshold', thrshldParams)
+    thrshldResults = stageLoad(thrshldKey)
+
+    if thrshldResults is None:
+        miscStart = len(misc)
+        if exactThrshld == True:
+            thrshld = smThresholds_exact(snpDF)[1]
+        else:
+            thrshld = smThresholds_gw(snpDF)[1]
+
+        thrshldResults = {'threshold': thrshld, 'misc': misc[miscStart:]}
+        stageSave(thrshldKey, thrshldParams, thrshldResults)
     else:
-        thrshld = smThresholds_proximal(snpDF)[1]
+        thrshld = thrshldResults['threshold']
+        misc.extend([miscName, np.array(miscVal)] for miscName, miscVal in thrshldResults['misc'])
 
-    with open(os.path.join(path, 'threshold.txt'), 'w') as xie:
-        xie.write(str(thrshld))
-else:
-    with open(os.path.join(path, 'threshold.txt'), 'r') as du:
-        thrshld = float(du.readline().strip())
+    return thrshld
 
-# Identify likely trait-associated SNPs
-fe = snpDF[snpDF['FE_P']<alpha]
 
-# Plot layout setup
-heightRatio = [1,0.8]
-fig, axs = plt.subplots(nrows=len(heightRatio), ncols=len(chrmIDL), figsize=(20, 10), sharex='col', sharey='row', 
-        gridspec_kw={'width_ratios': chrmSzL, 'height_ratios': heightRatio})
+def swSweep(chrmIDL, swSizeL, stepL):
+    '''
+    Sliding window statistics of every combination of the window sizes in swSizeL and the incremental steps in stepL,
+    calculated from a single index of each chromosome (swIndex), and the genome-wide threshold of each window size,
+    calculated with a single simulation in which the sliding windows of all the sizes are sampled together. The
+    results of all the combinations are saved in the table swSweep.csv, one row per sliding window.
+    Return a dictionary with the window sizes as its keys and the thresholds as its values
+    '''
+    print(f'Sweep the sliding window sizes {swSizeL} and the incremental steps {stepL}')
+
+    # The average number of SNPs in a sliding window of each size
+    sizeArr = np.maximum([int(len(snpDF.index) * size / sum(chrmSzL)) for size in swSizeL], 1)
+    misc.append(['Average SNPs per sliding window of each size', dict(zip(swSizeL, sizeArr.tolist()))])
+
+    # The thresholds of all the sizes are calculated or retrieved together
+    sweepParams = {'fisher': [fisherKeys[chrmID] for chrmID in chrmIDL], 'exact': exactThrshld, 'smalpha': smAlpha, 'swsizes': swSizeL}
+    if exactThrshld == False:
+        sweepParams.update({'replication': rep, 'adaptive': adaptiveRep, 'tolerance': smTolerance if adaptiveRep == True else None})
+    sweepKey = stageKey('sweep', sweepParams)
+    sweepResults = stageLoad(sweepKey)
+
+    if sweepResults is None:
+        if exactThrshld == True:
+            from scipy.stats import binom
+
+            sigProb = nullSigProb(snpDF[fb_LD].to_numpy(), snpDF[sb_LD].to_numpy(), fb_Freq, sb_Freq, smAlpha).mean()
+            thrshldArr = binom.ppf(0.995, sizeArr, sigProb) / sizeArr
+        elif adaptiveRep == False:
+            thrshldArr = np.percentile(smRatios(snpDF[fb_LD].to_numpy(), snpDF[sb_LD].to_numpy(), rep, sizeArr.max(), sizeArr=sizeArr), 99.5, axis=0)
+        else:
+            thrshldArr = np.percentile(smRatiosAdaptive(snpDF[fb_LD].to_numpy(), snpDF[sb_LD].to_numpy(), sizeArr.max(), sizeArr=sizeArr)[0], 99.5, axis=0)
 
-# Perform plotting
-bsaseqPlot(chrmIDL, fe, snpDF)
+        sweepResults = {'thresholds': thrshldArr}
+        stageSave(sweepKey, sweepParams, sweepResults)
 
-if 'fisher' not in sys.modules:
-    try:
-        from fisher import pvalue_npy
-    except ImportError:
-        print('The module \'Fisher\' is not installed on your computer')
-
-# Handle the plot with a single column (chromosome)
-if len(chrmIDL) == 1:
-    fig.align_ylabels(axs[:])
-# Handle the plot with multiple columns (chromosomes)
-else:
-    fig.align_ylabels(axs[:, 0])
-
-# fig.tight_layout(pad=0.15, rect=[0, 0.035, 1, 1])
-fig.subplots_adjust(top=0.96, bottom=0.073, left=0.064, right=0.995, hspace=hGap, wspace=wGap)
-fig.suptitle('Genomic position (\u00D710 Mb)', y=0.002, ha='center', va='bottom')
-fig.text(0.001, 0.995, 'a', weight='bold', ha='left', va='top')
-fig.text(0.001, 0.435, 'b', weight='bold', ha='left', va='bottom')
-
-fig.savefig(os.path.join(results, 'PyBSASeq.pdf'))
-# fig.savefig(os.path.join(results, 'PyBSASeq.png'), dpi=600)
-
-peaklst = pkList(snpRegion)
-
-if additionalPeaks.lower() == 'yes':
-    with open(os.path.join(path, 'additionalPeaks.txt'), 'r') as inF:
-        for line in inF:
-            if not line.startswith('#'):
-                a = line.rstrip().split()
+    thrshldDict = dict(zip(swSizeL, np.array(sweepResults['thresholds']).tolist()))
+    misc.append(['Genome-wide sSNP/totalSNP ratio threshold of each sliding window size', thrshldDict])
+    print(f'Threshold calculation completed, time elapsed: {(time.time()-t0)/60} minutes')
 
-                additionalSW = swDataFrame[(swDataFrame.CHROM==a[0]) & (swDataFrame.sw_Str >= int(a[1])) & (swDataFrame.sw_Str <= int(a[2]))]
-                peakSW = additionalSW[additionalSW[r'sSNP/totalSNP'] == additionalSW[r'sSNP/totalSNP'].max()]
+    # The SNPs of each chromosome are sorted and summed once for all the combinations
+    sweepL = []
+    for chrmID in chrmIDL:
+        chT = chrmSNPs(chrmID)
+        ch = chT[chT['FE_P']<alpha]
 
-                for row in peakSW.itertuples():
-                    peaklst.append([row.CHROM, row.sw_Str])
+        if swThrshldMode == True:
+            sigProbArr = nullSigProb(chT[fb_LD].to_numpy(), chT[sb_LD].to_numpy(), fb_Freq, sb_Freq, smAlpha)
+        else:
+            sigProbArr = None
+        swIdx = swIndex(chT['POS'].to_numpy(), ch['POS'].to_numpy(), chT[fb_LD].to_numpy(), chT[sb_LD].to_numpy(), sigProbArr)
 
-peaklst = sorted(peaklst, key = lambda x: (int(x[0]), int(x[1])))
+        for size in swSizeL:
+            for step in stepL:
+                swStats = swSeries(swIdx, chT['POS'].max(), size, step)
+                sweepL.append(pd.DataFrame({'swSize': size, 'step': step, 'CHROM': chrmID, 'sw_Str': swStats[0],
+                    fbID+'.AvgLD': swStats[3], sbID+'.AvgLD': swStats[4], 'sSNP': swStats[1], 'totalSNP': swStats[2],
+                    r'sSNP/totalSNP': swStats[5], 'Threshold': swStats[6] if swThrshldMode == True else thrshldDict[size]}))
+
+    sweepDF = pd.concat(sweepL, ignore_index=True).sort_values(['swSize', 'step'], kind='stable')
+    queueOutput(resultFile('swSweep.csv'), writeTable, sweepDF, resultFile('swSweep.csv'))
+    print(f'Sliding window sweep completed, time elapsed: {(time.time()-t0)/60} minutes')
+
+    return thrshldDict
+
+
+def peakVerification():
+    '''
+    Verify the peaks of the QTLs in snpRegion and the additional peaks, if requested, with the thresholds of their
+    sliding windows (accurateThreshold_sw). Return the list of the peaks
+    '''
+    peaklst = pkList(snpRegion)
+
+    if additionalPeaks.lower() == 'yes':
+        peaklst.extend(additionalPeakList(peakFile))
+
+    # The peaks are sorted by the position of their chromosome in chrmIDL, so any chromosome name can be used
+    peaklst = sorted(peaklst, key = lambda x: (chrmIdx.at[x[0], 'SortID'], int(x[1])))
 
-try:
     accurateThreshold_sw(peaklst)
     print(f'Peak verification completed, time elapsed: {(time.time()-t0)/60} minutes')
-except NameError:
-    accurateThreshold_gw(peaklst)
-    print('Please install the module \'Fisher\' if more precise thresholds of the QTL loci are desired')
 
-misc.append(['Running time', [(time.time()-t0)/60]])
+    return peaklst
+
+
+def finish():
+    # Wait for the output files, save the information of the run, and stop the writer threads
+    outputWait()
+    misc.append(['Running time', [(time.time()-t0)/60]])
+
+    with open(os.path.join(results, 'misc_info.csv'), 'w', newline='') as outF:
+        xie = csv.writer(outF)
+        xie.writerows(misc)
+
+    for pool in outputPools:
+        pool.shutdown()
+
+
+def batchJobs(manifestFile, argDict):
+    '''
+    Read the manifest of a batch, a TOML file with a [[jobs]] table per job or a YAML file with a list 'jobs'. The
+    options of a job replace those of the command line (argDict); its optional key 'name' is the name of the folder
+    of its results, 'job1', 'job2', ... by default. The jobs of an input file share a working directory in the folder
+    'BatchRuns', named after the file, so their stages are shared through its stage cache.
+    Return a list of the options of the jobs
+    '''
+    ap = argParser()
+    jobL, nameS, workDirDict = [], set(), {}
+    for n, jobDict in enumerate(readConfig(manifestFile).get('jobs', []), 1):
+        jobDict = dict(jobDict)
+        jobName = checkName(str(jobDict.pop('name', f'job{n}')))
+        if jobName in nameS:
+            print(f'Duplicated job name in the manifest: {jobName}')
+            sys.exit(1)
+        nameS.add(jobName)
+
+        # The options of the job are parsed like the command line options, with its options as the defaults
+        ap.set_defaults(**{**argDict, 'batch': None, 'config': None, 'name': jobName, **configOptions(jobDict, ap)})
+        jobArgs = vars(ap.parse_args([]))
+
+        # The jobs run without any prompt, and the threshold of each job is calculated in a single process
+        if jobArgs['chromosomes'] is None:
+            jobArgs['chromosomes'] = 'all'
+        jobArgs['jobs'] = 1
+
+        # Input files with the same name in different folders get different working directories
+        inputPath = os.path.abspath(jobArgs['input'])
+        if inputPath not in workDirDict:
+            workDir = os.path.join(os.getcwd(), 'BatchRuns', os.path.basename(inputPath))
+            while workDir in workDirDict.values():
+                workDir += '_'
+            workDirDict[inputPath] = workDir
+        if jobDict.get('workdir') is None:
+            jobArgs['workdir'] = workDirDict[inputPath]
+
+        jobL.append(jobArgs)
+
+    if jobL == []:
+        print('No job is found in the manifest.')
+        sys.exit(1)
+
+    return jobL
+
+
+def runJob(jobArgs):
+    '''
+    Run the pipeline with the options of a job of a batch. A failed job does not stop the batch.
+    Return the name of the job, its input file, the folder of its results, its status, and its running time
+    '''
+    jobT0 = time.time()
+    print(f'\nJob {jobArgs["name"]}: {jobArgs["input"]}')
+    try:
+        run(jobArgs)
+        status = 'completed'
+    except (Exception, SystemExit) as e:
+        print(f'Job {jobArgs["name"]} failed: {e!r}')
+        status = 'failed'
+
+    return [jobArgs['name'], jobArgs['input'], os.path.join(jobArgs['workdir'], 'Results', jobArgs['name']), status, (time.time()-jobT0)/60]
+
+
+def runBatch(argDict):
+    '''
+    Run the jobs in the manifest of a batch with a pool of '--jobs' processes. The first job of each set of parameters
+    of SNP filtering and Fisher's exact test of an input file runs before the others, so the other jobs of the set
+    retrieve the results from the stage cache instead of calculating them again, and the jobs of an input file never
+    calculate the same stage at the same time. The jobs are sorted by input file, so a worker process tends to run
+    the jobs of the same file and reuse the SNP table it has read (snpTables)
+    '''
+    jobL = batchJobs(argDict['batch'], argDict)
+
+    # The sets of jobs run one after another: the i-th set contains the i-th new set of parameters of Fisher's exact
+    # test of each input file, and the last set the remaining jobs
+    waveL, leaderDict, restL = [], {}, []
+    for jobArgs in jobL:
+        inputPath = os.path.abspath(jobArgs['input'])
+        fisherSet = tuple(jobArgs[option] for option in fisherOptions)
+        leaderDict.setdefault(inputPath, {})
+        if fisherSet in leaderDict[inputPath]:
+            restL.append(jobArgs)
+            continue
+
+        leaderDict[inputPath][fisherSet] = jobArgs
+        if len(waveL) < len(leaderDict[inputPath]):
+            waveL.append([])
+        waveL[len(leaderDict[inputPath])-1].append(jobArgs)
+
+    waveL.append(sorted(restL, key=lambda x: os.path.abspath(x['input'])))
+
+    numOfWorkers = min(max(1, argDict['jobs']), max(len(wave) for wave in waveL))
+    if numOfWorkers > 1 and 'fork' not in mp.get_all_start_methods():
+        print('Parallel batch execution is not supported on this platform, a single process is used.')
+        numOfWorkers = 1
+
+    summaryL = []
+    if numOfWorkers == 1:
+        for wave in waveL:
+            summaryL.extend(runJob(jobArgs) for jobArgs in wave)
+    else:
+        with mp.get_context('fork').Pool(numOfWorkers) as pool:
+            for wave in waveL:
+                summaryL.extend(pool.map(runJob, wave, chunksize=1))
+
+    # Summary of the jobs in the order of the manifest
+    summaryDict = {summary[0]: summary for summary in summaryL}
+    batchPath = os.path.join(os.getcwd(), 'BatchRuns')
+    os.makedirs(batchPath, exist_ok=True)
+    with open(os.path.join(batchPath, 'batchSummary.csv'), 'w', newline='') as outF:
+        xie = csv.writer(outF)
+        xie.writerow(['Name', 'Input', 'Results', 'Status', 'Running time (minutes)'])
+        xie.writerows(summaryDict[jobArgs['name']] for jobArgs in jobL)
+
+    print(f'\n{sum(summary[3] == "completed" for summary in summaryL)} of {len(jobL)} jobs completed, see {os.path.join(batchPath, "batchSummary.csv")}')
+
+
+def run(argDict):
+    '''
+    Run the entire pipeline with the options in argDict (parseArgs). The stages can be run separately as well, in the
+    same order
+    '''
+    setup(argDict)
+    ingest()
+    selectChromosomes(argDict['chromosomes'], argDict['peaks'])
+    filterAndTest()
+
+    # In the sweep mode, the sliding windows of all the window sizes and steps are calculated instead of the rest of the
+    # pipeline
+    if argDict['swsizes'] is not None:
+        stepL = [incrementalStep] if argDict['steps'] is None else [int(x) for x in str(argDict['steps']).split(',')]
+        swSweep(chrmIDL, [int(x) for x in str(argDict['swsizes']).split(',')], stepL)
+        finish()
+        return
+
+    threshold()
+    swStatistics(chrmIDL)
+
+    if argDict['noplot'] == False:
+        bsaseqPlot(chrmIDL)
+
+    peakVerification()
+    finish()
+
+
+def main(argv=None):
+    # Run the pipeline, or the jobs of a batch, with the command line options in argv (sys.argv[1:] if None)
+    argDict = parseArgs(argv)
+    if argDict['batch'] is not None:
+        runBatch(argDict)
+        return
+
+    run(argDict)
+
+    if argDict['swsizes'] is None:
+        print('\nIf two or more peaks and all the values in between are greater than the threshold, these peaks would be recognized as a single peak. You can rerun the script if additional peaks are desired to be identified, a file \'additionalPeaks.txt\' (template provided) cotaining the chromosome ID and the range info (start and end) of the interested regions needs to be created in the working directory.\n')
 
-with open(os.path.join(results, 'misc_info.csv'), 'w', newline='') as outF:
-    xie = csv.writer(outF)
-    xie.writerows(misc)
 
-print('\nIf two or more peaks and all the values in between are greater than the threshold, these peaks would be recognized as a single peak. You can rerun the script if additional peaks are desired to be identified, a file \'additionalPeaks.txt\' (template provided) cotaining the chromosome ID and the range info (start and end) of the interested regions needs to be created in the working directory.\n')
\ No newline at end of file
+if __name__ == '__main__':
+    main()